@@ -0,0 +1,271 @@
+"""
+aioconvert.py
+  Convert Markdown text to Re:VIEW text from asyncio.
+"""
+
+
+import asyncio
+import concurrent.futures
+import re
+import threading
+import mdparser
+import pymd2re
+from diagnostics import CollectOutput, DiagnosticSink
+
+
+# 改行コード(ファイルの読み込みと同様に \r\n \r \n を改行とする)
+_regex_newline = re.compile(r'\r\n|\r|\n')
+
+
+def split_lines(text):
+    '''
+    テキストを改行を除いた行のリストに分割
+
+    ファイルから読み込んだ場合と同じ行とするため、末尾の改行の後は行としない
+    '''
+    lines = _regex_newline.split(text)
+    if lines[-1] == '':
+        lines.pop()
+
+    return lines
+
+
+class AsyncConverter:
+    '''
+    非同期変換クラス
+
+    asyncio のイベントループから使用し、パースとレンダリングは管理するスレッドプールで実行する
+    同時に実行する変換の数を max_concurrency 個に制限し、超えた分は空きを待つ
+    変換のキャンセルとタイムアウトは、トップレベルのブロックの区切りで変換を中止する
+    ※パースとレンダリングは GIL を保持するため、変換どうしが並列に実行されるわけではない
+      イベントループのスレッドは sys.getswitchinterval() ごとに実行されるため、変換中も応答できる
+    '''
+
+    # 定数
+    DEFAULT_CHUNK_SIZE = 64 * 1024      # iter_convert() で返す文字列の文字数の目安
+    REPORT_SIZE = 1024                  # イベントループの１回の処理で出力先に登録する警告の数
+
+    def __init__(self, workers=None, max_concurrency=None, sink=None):
+        '''
+        コンストラクタ
+
+        workers はスレッドプールのスレッド数(省略時は concurrent.futures.ThreadPoolExecutor の既定値)
+        max_concurrency は同時に実行する変換の数(省略時は workers、または 4)
+        sink に diagnostics.DiagnosticSink を与えると、各変換の警告の既定の出力先とする(省略時は標準出力)
+        '''
+        # 変換を実行するスレッドプール
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pymd2re')
+        # 同時に実行する変換の数
+        self.max_concurrency = max_concurrency or workers or 4
+        # 警告の既定の出力先
+        self.sink = sink if sink is not None else DiagnosticSink()
+
+        # 同時実行数を制限するセマフォ
+        # ※イベントループ上で作成するため、最初の変換時に作成する
+        self._semaphore = None
+
+    async def __aenter__(self):
+        '''
+        async with 文の開始
+        '''
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        '''
+        async with 文の終了
+        '''
+        self.close()
+
+    def close(self):
+        '''
+        スレッドプールを終了する
+
+        実行中の変換の終了は待たない
+        '''
+        self._executor.shutdown(wait=False)
+
+    async def convert(self, text, timeout=None, sink=None):
+        '''
+        Markdownテキスト(文字列、または改行を除いた行のリスト)をRe:VIEWテキストに変換
+
+        timeout 秒以内に終了しなければ変換を中止し、asyncio.TimeoutError を送出する(空きを待つ時間を含む)
+        警告は sink (省略時はコンストラクタの sink)に変換の終了時にまとめて登録する
+        '''
+        return await asyncio.wait_for(self._convert(text, sink), timeout)
+
+    async def iter_convert(self, text, timeout=None, sink=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        '''
+        Markdownテキストを変換し、Re:VIEWテキストを chunk_size 文字程度ずつ返す非同期イテレータ
+
+        出力全体を保持せずに、変換した分から順に返す
+        timeout は全体を返し終えるまでの時間(利用側の処理時間を含む)とし、超えると asyncio.TimeoutError を送出する
+        途中で利用を止めた場合は、このイテレータを閉じた時点で変換を中止し、同時実行数の枠を解放する
+        ※break などで async for を抜けただけでは、ガベージコレクトされるまで閉じられないため、
+          contextlib.aclosing() (Python 3.10 以降)で囲むか、aclose() を呼ぶこと
+            async with contextlib.aclosing(converter.iter_convert(text)) as chunks:
+                async for chunk in chunks:
+                    ...
+        '''
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout is not None else None
+
+        def remaining():
+            '''
+            期限までの残り時間
+            '''
+            return deadline - loop.time() if deadline is not None else None
+
+        await asyncio.wait_for(self._acquire(), remaining())
+        try:
+            records = CollectOutput()
+            chunks = _iter_chunks(text, DiagnosticSink(records, (sink or self.sink).level), chunk_size)
+            try:
+                while True:
+                    # 次の文字列を変換する間だけスレッドで実行する
+                    chunk = await asyncio.wait_for(self._run(next, chunks, None), remaining())
+                    await self._report(records, sink)
+                    if chunk is None:
+                        break
+                    yield chunk
+            finally:
+                chunks.close()
+                await self._report(records, sink)
+        finally:
+            self._semaphore.release()
+
+    async def _convert(self, text, sink):
+        '''
+        変換処理(タイムアウトなし)
+        '''
+        await self._acquire()
+        try:
+            records = CollectOutput()
+            try:
+                return await self._run(_convert_text, text, DiagnosticSink(records, (sink or self.sink).level))
+            finally:
+                await self._report(records, sink)
+        finally:
+            self._semaphore.release()
+
+    async def _acquire(self):
+        '''
+        同時実行数の空きを待つ
+        '''
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        await self._semaphore.acquire()
+
+    async def _run(self, func, *args):
+        '''
+        関数をスレッドプールで実行し、結果を返す
+
+        キャンセルされた場合は中止を指示し、スレッドでの実行が終わるまで待ってから CancelledError を送出する
+        ※同時実行数の枠は、実際に実行が終わるまで解放しない
+        '''
+        cancel = threading.Event()
+        future = asyncio.get_running_loop().run_in_executor(self._executor, _call, func, args, cancel)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            cancel.set()
+            try:
+                await future
+            except (Exception, asyncio.CancelledError):
+                pass
+            raise
+
+    async def _report(self, records, sink):
+        '''
+        変換中に集めた警告を出力先に登録する
+
+        出力先への登録はイベントループのスレッドで行い、各変換の警告は発生順に登録する
+        警告が多い場合もイベントループを止めないよう、REPORT_SIZE 個ごとに他の処理に切り替える
+        '''
+        sink = sink or self.sink
+        while records.records:
+            batch = records.records[:self.REPORT_SIZE]
+            del records.records[:self.REPORT_SIZE]
+            for record in batch:
+                sink.report(record.level, record.linenum, record.kind, record.message)
+            sink.flush()
+            if records.records:
+                await asyncio.sleep(0)
+
+
+class ConversionCancelled(Exception):
+    '''
+    変換の中止を示す例外(スレッド内でのみ使用する)
+    '''
+    pass
+
+
+# スレッドごとの中止の指示
+_local = threading.local()
+
+
+def _call(func, args, cancel):
+    '''
+    スレッドで関数を実行する
+
+    実行中は cancel (threading.Event) を _check_cancel() から参照できるようにする
+    '''
+    _local.cancel = cancel
+    try:
+        return func(*args)
+    except ConversionCancelled:
+        return None
+    finally:
+        _local.cancel = None
+
+
+def _check_cancel():
+    '''
+    中止が指示されていれば ConversionCancelled を送出する
+    '''
+    cancel = getattr(_local, 'cancel', None)
+    if cancel is not None and cancel.is_set():
+        raise ConversionCancelled()
+
+
+def _iter_top_blocks(md_parser, lines):
+    '''
+    トップレベルのブロックを順に返すイテレータ
+
+    ブロックごとに中止の指示を確認する
+    '''
+    for block in md_parser.iter_blocks(lines):
+        _check_cancel()
+        yield block
+
+
+def _convert_text(text, sink):
+    '''
+    テキスト、または行のリストを変換(スレッドで実行する)
+    '''
+    lines = split_lines(text) if isinstance(text, str) else text
+    md_parser = mdparser.MarkdownParser(diagnostics=sink)
+    re_renderer = pymd2re.ReviewRenderer(diagnostics=sink)
+    return ''.join(re_renderer.iter_render(_iter_top_blocks(md_parser, lines)))
+
+
+def _iter_chunks(text, sink, chunk_size):
+    '''
+    テキスト、または行のリストを変換し、chunk_size 文字程度ずつ返すイテレータ(各文字列はスレッドで変換する)
+    '''
+    lines = split_lines(text) if isinstance(text, str) else text
+    md_parser = mdparser.MarkdownParser(diagnostics=sink)
+    re_renderer = pymd2re.ReviewRenderer(diagnostics=sink)
+
+    output = []
+    # 返していない文字数
+    pending = 0
+    for text in re_renderer.iter_render(_iter_top_blocks(md_parser, lines)):
+        output.append(text)
+        pending += len(text)
+        if pending >= chunk_size:
+            yield ''.join(output)
+            output = []
+            pending = 0
+
+    if output:
+        yield ''.join(output)
@@ -0,0 +1,855 @@
+"""
+benchmark.py
+  Measure processing time of Markdown parser and Re:VIEW renderer.
+"""
+
+
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import diagnostics
+import mdparser
+import pymd2re
+
+
+# サンプルファイルのパス
+SAMPLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sample', 'sample_input.md')
+# 変換スクリプトのパス
+PYMD2RE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pymd2re.py')
+# 変換サーバーとクライアントのパス
+SERVER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')
+CLIENT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'client.py')
+
+
+def main():
+    '''
+    メイン
+    '''
+    # 引数解析
+    parser = argparse.ArgumentParser(description='Measure processing time of Markdown parser and Re:VIEW renderer.')
+    subparsers = parser.add_subparsers(dest='command')
+
+    parser_suite = subparsers.add_parser('suite', help='Measure each kind of block and record results. (default)')
+    parser_suite.add_argument('-n', '--lines', type=int, default=10000,
+                              help='Line count of each generated document. (default: %(default)s)')
+    parser_suite.add_argument('-r', '--repeat', type=int, default=3,
+                              help='Number of measurements. The fastest is recorded. (default: %(default)s)')
+    parser_suite.add_argument('-k', '--kinds', nargs='+', choices=list(GENERATORS), default=list(GENERATORS),
+                              help='Kinds of generated documents. (default: all)')
+    parser_suite.add_argument('-o', '--output', help='Output File Path. (JSON file)')
+    parser_suite.add_argument('-c', '--compare', help='Previous result to compare with. (JSON file)')
+    parser_suite.add_argument('-t', '--threshold', type=float, default=1.2,
+                              help='Ratio to the previous result regarded as a regression. (default: %(default)s)')
+
+    parser_scaling = subparsers.add_parser('scaling', help='Check that parse time grows linearly with line count.')
+    parser_scaling.add_argument('-s', '--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000],
+                                help='Line counts of generated documents. (default: 1000 10000 100000 1000000)')
+
+    parser_nested = subparsers.add_parser('nested', help='Check that render time does not grow with list depth.')
+    parser_nested.add_argument('-d', '--depths', type=int, nargs='+', default=[10, 50, 200],
+                               help='Nesting depths of generated lists. (default: 10 50 200)')
+
+    parser_tree = subparsers.add_parser('tree', help='Compare loading a saved document tree with parsing.')
+    parser_tree.add_argument('-n', '--lines', type=int, default=100000,
+                             help='Line count of the generated document. (default: %(default)s)')
+    parser_tree.add_argument('-r', '--repeat', type=int, default=3,
+                             help='Number of measurements. The fastest is recorded. (default: %(default)s)')
+
+    parser_reparse = subparsers.add_parser('reparse', help='Check that reparse time of an edit does not grow with document size.')
+    parser_reparse.add_argument('-s', '--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                                help='Line counts of generated documents. (default: 1000 10000 100000)')
+    parser_reparse.add_argument('-e', '--edits', type=int, default=200,
+                                help='Number of edits on each document. (default: %(default)s)')
+
+    parser_parallel = subparsers.add_parser('parallel', help='Compare parallel parsing of a large file with serial parsing.')
+    parser_parallel.add_argument('-n', '--lines', type=int, default=200000,
+                                 help='Number of lines. (default: %(default)s)')
+    parser_parallel.add_argument('-j', '--jobs', type=int, nargs='+', default=[2, 4, 8],
+                                 help='Numbers of worker processes. (default: %(default)s)')
+
+    parser_walk = subparsers.add_parser('walk', help='Check that tree walk cost per node does not grow with nesting depth.')
+    parser_walk.add_argument('-d', '--depths', type=int, nargs='+', default=[10, 1000, 10000, 100000],
+                             help='Nesting depths of generated quotes. (default: 10 1000 10000 100000)')
+    parser_walk.add_argument('-n', '--nodes', type=int, default=200000,
+                             help='Number of blocks in each generated document. (default: %(default)s)')
+    parser_walk.add_argument('-t', '--threshold', type=float, default=1.5,
+                             help='Time per node relative to the first depth above which the check fails. (default: %(default)s)')
+
+    parser_startup = subparsers.add_parser('startup', help='Measure cold conversion of a small file in a new process.')
+    parser_startup.add_argument('-n', '--lines', type=int, default=10,
+                                help='Line count of the converted document. (default: %(default)s)')
+    parser_startup.add_argument('-r', '--repeat', type=int, default=20,
+                                help='Number of measurements. The fastest is recorded. (default: %(default)s)')
+    parser_startup.add_argument('-p', '--path', default=PYMD2RE_PATH,
+                                help='pymd2re.py to measure, e.g. in a worktree of another commit. (default: this tree)')
+    parser_startup.add_argument('-o', '--output', help='Output File Path. (JSON file)')
+    parser_startup.add_argument('-c', '--compare', help='Previous result to compare with. (JSON file)')
+    parser_startup.add_argument('-t', '--threshold', type=float, default=1.2,
+                                help='Ratio to the previous result regarded as a regression. (default: %(default)s)')
+
+    parser_server = subparsers.add_parser('server', help='Compare conversion through server.py with cold conversion.')
+    parser_server.add_argument('-n', '--lines', type=int, default=200,
+                               help='Line count of the converted document. (default: %(default)s)')
+    parser_server.add_argument('-r', '--repeat', type=int, default=20,
+                               help='Number of measurements. The fastest is recorded. (default: %(default)s)')
+
+    parser_inline = subparsers.add_parser('inline', help='Check that inline and block parse time grows linearly with line length.')
+    parser_inline.add_argument('-s', '--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000],
+                               help='Lengths of generated lines. (default: 1000 10000 100000 1000000)')
+    parser_inline.add_argument('-f', '--fuzz', type=int, default=100000,
+                               help='Number of random lines compared with regular expression matching. (default: %(default)s)')
+
+    args = parser.parse_args()
+
+    # 解析時間が行数に比例することを確認する
+    if args.command == 'scaling':
+        bench_scaling(args.sizes)
+        return 0
+
+    # 深くネストしたリストのレンダリング時間を確認する
+    if args.command == 'nested':
+        bench_nested_list(args.depths)
+        return 0
+
+    # 保存した文書木の読み込みと解析の時間を比較する
+    if args.command == 'tree':
+        bench_tree(args.lines, args.repeat)
+        return 0
+
+    # 編集時の再解析時間が文書の大きさに依存しないことを確認する
+    if args.command == 'reparse':
+        bench_reparse(args.sizes, args.edits)
+        return 0
+
+    # 大きなファイルの並列パース処理の時間を逐次処理と比較する
+    if args.command == 'parallel':
+        bench_parallel(args.lines, args.jobs)
+        return 0
+
+    # ネストの深さによらずに文書木をたどれることを確認する
+    if args.command == 'walk':
+        return 0 if bench_walk(args.depths, args.nodes, args.threshold) else 1
+
+    # インライン解析の時間が行の長さに比例し、結果が正規表現による照合と一致することを確認する
+    if args.command == 'inline':
+        return 0 if bench_inline(args.sizes, args.fuzz) else 1
+
+    # 変換サーバーを使用した変換時間を、新しいプロセスでの変換と比較する
+    if args.command == 'server':
+        bench_server(args.lines, args.repeat)
+        return 0
+
+    # 新しいプロセスでの小さなファイルの変換時間を計測する
+    if args.command == 'startup':
+        results = bench_startup(args.path, args.lines, args.repeat)
+    # ブロックの種類ごとに計測する
+    else:
+        if args.command is None:
+            args = parser_suite.parse_args([])
+        results = bench_suite(args.kinds, args.lines, args.repeat)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+        if not compare_results(previous, results, args.threshold):
+            return 1
+
+    return 0
+
+
+def make_lines(count):
+    '''
+    サンプルファイルを繰り返して指定行数の文書を生成
+    '''
+    with open(SAMPLE_PATH, 'r', encoding='utf-8') as f:
+        sample_lines = [l.rstrip('\r\n') for l in f.readlines()]    # 改行を除去
+    # 連結部分で直前のブロックと混ざらないよう空行を挟む
+    sample_lines.append('')
+
+    return repeat_lines(sample_lines, count)
+
+
+def repeat_lines(unit, count):
+    '''
+    行のまとまりを繰り返して指定行数の文書を生成
+    '''
+    repeat = count // len(unit) + 1
+    return (unit * repeat)[:count]
+
+
+# 文書の種類ごとの繰り返し単位
+# ※各単位の末尾には空行を入れ、隣り合う単位が１つのブロックにまとまらないようにする
+
+def make_header_lines(count):
+    '''
+    見出し
+    '''
+    unit = ['# Header *1*', '## Header `2`', 'Header 1', '========', 'Header 2', '--------', '']
+    return repeat_lines(unit, count)
+
+
+def make_comment_lines(count):
+    '''
+    コメント
+    '''
+    unit = ['<!-- single line comment -->', '<!--', 'multi line', 'comment', '-->', '']
+    return repeat_lines(unit, count)
+
+
+def make_hr_lines(count):
+    '''
+    水平線
+    '''
+    return repeat_lines(['***', '', '---', '', '___', ''], count)
+
+
+def make_image_lines(count):
+    '''
+    画像
+    '''
+    unit = ['![image](http://example.com/image.png)', '![image](http://example.com/image.png "caption")', '']
+    return repeat_lines(unit, count)
+
+
+def make_pre_lines(count):
+    '''
+    長い整形済みテキスト
+    '''
+    unit = ['    preformatted *text* {}'.format(i) for i in range(200)] + ['']
+    return repeat_lines(unit, count)
+
+
+def make_code_lines(count):
+    '''
+    長いコード
+    '''
+    unit = ['```python'] + ['    value = call_{}(`x`, *args)'.format(i) for i in range(500)] + ['```', '']
+    return repeat_lines(unit, count)
+
+
+def make_quote_lines(count):
+    '''
+    ネストした引用
+    '''
+    unit = ['>' * level + ' quoted *text* and `code`  ' for level in (1, 2, 3, 3, 2, 1)] + ['']
+    return repeat_lines(unit, count)
+
+
+def make_table_lines(count, columns=12):
+    '''
+    列数の多い表
+    '''
+    unit = []
+    unit.append('|' + '|'.join(' head {} '.format(c) for c in range(columns)) + '|')
+    unit.append('|' + '|'.join(':---:' for _ in range(columns)) + '|')
+    for row in range(20):
+        unit.append('|' + '|'.join(' *{}* `{}` '.format(row, c) for c in range(columns)) + '|')
+    unit.append('')
+    return repeat_lines(unit, count)
+
+
+def make_list_lines(count, depth=20):
+    '''
+    深くネストしたリスト
+    '''
+    return make_nested_list_lines(depth, count)
+
+
+def make_para_lines(count):
+    '''
+    インライン要素の多い段落
+    '''
+    line = ('plain *italic* **bold** ***both*** `code` ~~strike~~ :smile: '
+            '[link](http://example.com/) http://example.com/path ![image](image.png "caption") <!-- comment -->  ')
+    return repeat_lines([line] * 10 + [''], count)
+
+
+# 文書の種類と生成関数
+GENERATORS = {
+    'sample': make_lines,
+    'header': make_header_lines,
+    'comment': make_comment_lines,
+    'hr': make_hr_lines,
+    'image': make_image_lines,
+    'pre': make_pre_lines,
+    'code': make_code_lines,
+    'quote': make_quote_lines,
+    'table': make_table_lines,
+    'list': make_list_lines,
+    'para': make_para_lines,
+}
+
+
+def bench_suite(kinds, count, repeat):
+    '''
+    文書の種類ごとに、解析・インライン解析・レンダリングの時間とピークメモリを計測
+    '''
+    md_parser = mdparser.MarkdownParser()
+    re_renderer = pymd2re.ReviewRenderer()
+
+    results = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'lines': count,
+        'results': {},
+    }
+
+    print('{:>8} {:>10} {:>10} {:>10} {:>12}'.format('kind', 'parse', 'inline', 'render', 'peak(KB)'))
+    for kind in kinds:
+        lines = GENERATORS[kind](count)
+
+        # 解析(MarkdownParser.__call__)
+        parse_sec = measure(lambda: md_parser(lines), repeat)
+        doc = md_parser(lines)
+
+        # インライン解析(MarkdownParser._parse_inline)のみ
+        def parse_inline():
+            for line in lines:
+                md_parser._parse_inline(line)
+        inline_sec = measure(parse_inline, repeat)
+
+        # レンダリング(ReviewRenderer.__call__)
+        # ※警告の表示は計測対象外とする
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            render_sec = measure(lambda: re_renderer(doc), repeat)
+
+            # 解析とレンダリングを通したピークメモリ
+            del doc
+            tracemalloc.start()
+            re_renderer(md_parser(lines))
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        results['results'][kind] = {
+            'parse_sec': parse_sec,
+            'inline_sec': inline_sec,
+            'render_sec': render_sec,
+            'peak_bytes': peak,
+        }
+        print('{:>8} {:>10.4f} {:>10.4f} {:>10.4f} {:>12}'.format(kind, parse_sec, inline_sec, render_sec, peak // 1024))
+
+    return results
+
+
+def compare_results(previous, current, threshold):
+    '''
+    以前の結果と比較し、閾値を超えて悪化した項目を表示
+    悪化した項目がなければ真を返す
+    '''
+    print()
+    print('compared with {} ({})'.format(previous.get('commit'), 'ratio > {} is regression'.format(threshold)))
+
+    ok = True
+    for kind, values in current['results'].items():
+        prev_values = previous['results'].get(kind)
+        if prev_values is None:
+            continue
+
+        ratios = []
+        for name, value in values.items():
+            prev_value = prev_values.get(name)
+            if not prev_value:
+                continue
+            ratio = value / prev_value
+            mark = ''
+            if ratio > threshold:
+                mark = '!'
+                ok = False
+            ratios.append('{}={:.2f}{}'.format(name, ratio, mark))
+
+        print('{:>8} {}'.format(kind, ' '.join(ratios)))
+
+    return ok
+
+
+def measure(func, repeat):
+    '''
+    関数を繰り返し実行し、最短の実行時間を返す
+    '''
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+
+def git_commit(path=None):
+    '''
+    計測対象のコミットを取得(取得できない場合は None)
+    '''
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=path or os.path.dirname(SAMPLE_PATH),
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+    except OSError:
+        return None
+
+    return result.stdout.strip() or None
+
+
+def bench_scaling(sizes):
+    '''
+    文書の行数ごとの解析時間を計測
+    '''
+    md_parser = mdparser.MarkdownParser()
+
+    print('{:>10} {:>10} {:>12} {:>8}'.format('lines', 'sec', 'usec/line', 'ratio'))
+    base = None
+    for count in sizes:
+        lines = make_lines(count)
+
+        start = time.perf_counter()
+        md_parser(lines)
+        elapsed = time.perf_counter() - start
+
+        # 1行あたりの時間と、最初の計測に対する比率
+        # 線形時間であれば比率はおおむね 1.0 で一定となる
+        per_line = elapsed / count * 1e6
+        if base is None:
+            base = per_line
+        print('{:>10} {:>10.3f} {:>12.2f} {:>8.2f}'.format(count, elapsed, per_line, per_line / base))
+
+
+def make_nested_list_lines(depth, count):
+    '''
+    指定した深さまでネストしたリストを繰り返して指定行数の文書を生成
+    '''
+    lines = []
+    while len(lines) < count:
+        for level in range(depth):
+            lines.append(' ' * mdparser.MarkdownParser.INDENT_WIDTH * level + '- item *{}* '.format(level) + 'text ' * 20)
+        # リストを区切るため空行を挟む
+        lines.append('')
+
+    return lines[:count]
+
+
+def bench_tree(count, repeat):
+    '''
+    文書木の保存・読み込み時間を計測し、解析時間と比較
+    '''
+    md_parser = mdparser.MarkdownParser()
+    lines = make_lines(count)
+    doc = md_parser(lines)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'document.mdtree')
+
+        results = {}
+        results['parse'] = measure(lambda: md_parser(lines), repeat)
+        results['save'] = measure(lambda: mdparser.FlatDocument.from_block(doc).save(path), repeat)
+        results['load(flat)'] = measure(lambda: mdparser.FlatDocument.load(path), repeat)
+        results['load(block)'] = measure(lambda: mdparser.FlatDocument.load(path).to_block(), repeat)
+
+        input_size = sum(len(line.encode('utf-8')) + 1 for line in lines)
+        tree_size = os.path.getsize(path)
+
+    print('{:>12} {:>10} {:>8}'.format('', 'sec', 'ratio'))
+    for name, sec in results.items():
+        # 解析に対する比率
+        print('{:>12} {:>10.4f} {:>8.3f}'.format(name, sec, sec / results['parse']))
+
+    print()
+    print('input {} KB, saved tree {} KB'.format(input_size // 1024, tree_size // 1024))
+
+
+def bench_reparse(sizes, edits):
+    '''
+    文書の行数ごとに、1行の編集(行数不変)と1行の挿入の再解析時間を計測し、全体の解析時間と比較
+    '''
+    md_parser = mdparser.MarkdownParser()
+
+    print('{:>10} {:>10} {:>12} {:>12}'.format('lines', 'parse(ms)', 'replace(ms)', 'insert(ms)'))
+    for count in sizes:
+        lines = make_lines(count)
+
+        start = time.perf_counter()
+        doc = md_parser(lines)
+        parse_sec = time.perf_counter() - start
+
+        # 文書全体に散らばった位置の行を、同じ内容の行に置き換える
+        # ※行番号を変えずにキー入力ごとの再解析を模擬する
+        positions = [count * k // edits for k in range(edits)]
+        start = time.perf_counter()
+        for i in positions:
+            lines[i] = lines[i]
+            md_parser.reparse(doc, lines, i, i + 1, 1)
+        replace_sec = (time.perf_counter() - start) / edits
+
+        # 同じ位置に行を挿入して削除する(改行キーとバックスペースキー)
+        start = time.perf_counter()
+        for i in positions:
+            lines.insert(i, 'inserted *line*')
+            md_parser.reparse(doc, lines, i, i, 1)
+            del lines[i]
+            md_parser.reparse(doc, lines, i, i + 1, 0)
+        insert_sec = (time.perf_counter() - start) / (edits * 2)
+
+        print('{:>10} {:>10.1f} {:>12.3f} {:>12.3f}'.format(count, parse_sec * 1000, replace_sec * 1000, insert_sec * 1000))
+
+
+def bench_parallel(count, jobs):
+    '''
+    プロセス数ごとに並列パース処理の時間を計測し、逐次処理と比較
+    結果が逐次処理と一致することも確認する
+    '''
+    md_parser = mdparser.MarkdownParser()
+    lines = make_lines(count)
+
+    start = time.perf_counter()
+    expected = mdparser.FlatDocument.from_block(md_parser(lines)).to_bytes()
+    serial_sec = time.perf_counter() - start
+
+    print('cpus {}'.format(os.cpu_count()))
+    print('{:>8} {:>10} {:>8} {:>6}'.format('workers', 'sec', 'speedup', 'same'))
+    print('{:>8} {:>10.3f} {:>8.2f} {:>6}'.format('serial', serial_sec, 1.0, 'yes'))
+    for workers in jobs:
+        start = time.perf_counter()
+        doc = md_parser.parse_parallel(lines, workers)
+        elapsed = time.perf_counter() - start
+        same = mdparser.FlatDocument.from_block(doc).to_bytes() == expected
+        print('{:>8} {:>10.3f} {:>8.2f} {:>6}'.format(workers, elapsed, serial_sec / elapsed, 'yes' if same else 'NO'))
+
+
+def no_cache_options(path):
+    '''
+    変換結果キャッシュを使用しないための pymd2re.py の引数を取得
+
+    キャッシュ機能の無い以前のツリーとも比較できるよう、--help に --no-cache が無ければ空とする
+    '''
+    help_text = subprocess.run([sys.executable, path, '--help'], stdout=subprocess.PIPE,
+                               universal_newlines=True, check=True).stdout
+    return ['--no-cache'] if '--no-cache' in help_text else []
+
+
+def bench_startup(path, count, repeat):
+    '''
+    インタプリタの起動のみ、モジュールのインポート、小さなファイルの変換を新しいプロセスで計測
+    '''
+    results = {
+        'commit': git_commit(os.path.dirname(os.path.abspath(path))),
+        'python': platform.python_version(),
+        'lines': count,
+        'results': {},
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, 'input.md')
+        output_path = os.path.join(tmp_dir, 'output.re')
+        with open(input_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(make_lines(count)) + '\n')
+
+        # 計測対象のスクリプトと同じディレクトリからインポートする
+        import_code = 'import sys; sys.path.insert(0, {!r}); import pymd2re'.format(os.path.dirname(os.path.abspath(path)))
+        commands = {
+            'python_sec': [sys.executable, '-c', 'pass'],
+            'import_sec': [sys.executable, '-c', import_code],
+            'convert_sec': [sys.executable, path, *no_cache_options(path), input_path, output_path],
+        }
+
+        # 初回はバイトコードのキャッシュを作成するため計測対象外とする
+        for command in commands.values():
+            subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+
+        for name, command in commands.items():
+            results['results'].setdefault('startup', {})[name] = measure(
+                lambda: subprocess.run(command, stdout=subprocess.DEVNULL, check=True), repeat)
+
+        # インポートに時間のかかるモジュール(自身の時間、累計時間)
+        importtime = subprocess.run([sys.executable, '-X', 'importtime', '-c', import_code],
+                                    stderr=subprocess.PIPE, universal_newlines=True, check=True).stderr
+        modules = []
+        for line in importtime.splitlines()[1:]:
+            self_us, cumulative_us, name = line.split(':', 1)[1].split('|')
+            modules.append((int(cumulative_us), int(self_us), name.rstrip()))
+
+    print('{:>12} {:>10}'.format('', 'msec'))
+    for name, value in results['results']['startup'].items():
+        print('{:>12} {:>10.1f}'.format(name[:-len('_sec')], value * 1000))
+
+    print()
+    print('{:>10} {:>10}  {}'.format('self(ms)', 'total(ms)', 'imported module'))
+    for cumulative_us, self_us, name in sorted(modules, reverse=True)[:15]:
+        print('{:>10.1f} {:>10.1f}  {}'.format(self_us / 1000, cumulative_us / 1000, name))
+
+    return results
+
+
+def bench_server(count, repeat):
+    '''
+    変換サーバーを使用した変換時間を計測し、新しいプロセスでの変換と比較
+
+    クライアントを新しいプロセスで起動する場合と、接続済みのソケットから要求する場合を計測する
+    '''
+    import socket
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, 'input.md')
+        output_path = os.path.join(tmp_dir, 'output.re')
+        socket_path = os.path.join(tmp_dir, 'server.sock')
+        with open(input_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(make_lines(count)) + '\n')
+
+        server = subprocess.Popen([sys.executable, SERVER_PATH, socket_path, '-j', '1', '--no-cache'],
+                                  stdout=subprocess.PIPE, universal_newlines=True)
+        try:
+            # 待ち受けの開始を待つ
+            server.stdout.readline()
+
+            # インタプリタの起動のみの時間も比較のために計測する
+            commands = {
+                'python': [sys.executable, '-c', 'pass'],
+                'cold': [sys.executable, PYMD2RE_PATH, *no_cache_options(PYMD2RE_PATH), input_path, output_path],
+                'client': [sys.executable, CLIENT_PATH, socket_path, input_path, output_path],
+            }
+            # 初回はバイトコードのキャッシュを作成するため計測対象外とする
+            for command in commands.values():
+                subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+
+            results = {}
+            for name, command in commands.items():
+                results[name] = measure(lambda: subprocess.run(command, stdout=subprocess.DEVNULL, check=True), repeat)
+
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(socket_path)
+                f = sock.makefile('rwb')
+                message = json.dumps({'command': 'convert', 'input_path': input_path, 'output_path': output_path})
+
+                def request():
+                    f.write(message.encode('utf-8') + b'\n')
+                    f.flush()
+                    return json.loads(f.readline().decode('utf-8'))
+
+                results['request'] = measure(request, repeat)
+                # サーバー内の変換時間
+                results['convert'] = min(request()['convert_time'] for _ in range(repeat))
+
+                f.write(json.dumps({'command': 'shutdown'}).encode('utf-8') + b'\n')
+                f.flush()
+                f.readline()
+        finally:
+            server.wait()
+
+    print('{:>10} {:>10}'.format('', 'msec'))
+    for name, sec in results.items():
+        print('{:>10} {:>10.1f}'.format(name, sec * 1000))
+
+
+def bench_nested_list(depths, count=100000):
+    '''
+    リストのネストの深さごとのレンダリング時間を計測
+    '''
+    md_parser = mdparser.MarkdownParser()
+    re_renderer = pymd2re.ReviewRenderer()
+
+    print('{:>10} {:>10} {:>12} {:>8}'.format('depth', 'sec', 'usec/line', 'ratio'))
+    base = None
+    for depth in depths:
+        doc = md_parser(make_nested_list_lines(depth, count))
+
+        start = time.perf_counter()
+        re_renderer(doc)
+        elapsed = time.perf_counter() - start
+
+        # 1行あたりの時間と、最初の計測に対する比率
+        # 出力のコピー回数が深さに依存しなければ比率はおおむね 1.0 で一定となる
+        per_line = elapsed / count * 1e6
+        if base is None:
+            base = per_line
+        print('{:>10} {:>10.3f} {:>12.2f} {:>8.2f}'.format(depth, elapsed, per_line, per_line / base))
+
+
+def make_nested_quote_doc(depth, count):
+    '''
+    指定した深さまでネストした引用を繰り返して、指定ブロック数以上の文書を生成
+
+    Markdown では深さに比例した長さの行が必要になるため、ブロックを直接作成する
+    '''
+    doc = mdparser.Block()
+    blocks = 0
+    while blocks < count:
+        top = mdparser.Block(mdparser.Block.Kind.QUOTE_TOP, doc, blocks + 1)
+        doc.subitems.append(top)
+        cur_block = top
+        for level in range(1, depth + 1):
+            block = mdparser.Block(mdparser.Block.Kind.QUOTE_DATA, cur_block, blocks + level)
+            block.level = level
+            block.subitems.append(mdparser.Inline())
+            block.subitems[-1].texts.append('quote {}'.format(level))
+            cur_block.subitems.append(block)
+            cur_block = block
+        blocks += depth + 1
+
+    doc.finalize()
+    return doc
+
+
+def bench_walk(depths, count, threshold, repeat=5):
+    '''
+    引用のネストの深さごとに、文書木をたどる時間とレンダリング時間を計測
+
+    再帰呼び出しの上限(sys.getrecursionlimit())を超える深さも処理できることを確認する
+    ノードあたりの時間が最初の深さの threshold 倍を超えた場合は False を返す
+    計測環境の変動の影響を比率に含めないよう、各深さの文書は最初の深さの文書と交互に計測する
+    '''
+    # 警告(２段階以上の引用)は捨てる
+    sink = pymd2re.DiagnosticSink(diagnostics.SilentOutput())
+    re_renderer = pymd2re.ReviewRenderer(diagnostics=sink)
+
+    def walk(doc):
+        for _ in doc.walk():
+            pass
+
+    print('recursion limit {}'.format(sys.getrecursionlimit()))
+    print('{:>10} {:>10} {:>14} {:>16} {:>11} {:>13}'.format('depth', 'nodes', 'walk(us/node)', 'render(us/node)',
+                                                            'walk ratio', 'render ratio'))
+    ok = True
+    base_doc = None
+    for depth in depths:
+        doc = make_nested_quote_doc(depth, count)
+        # 文書木の作成で生じた循環ガベージコレクタの処理を計測に含めない
+        gc.collect()
+        # ブロックとインライン要素の数
+        nodes = sum(1 for _ in doc.walk())
+        if base_doc is None:
+            base_doc, base_nodes = doc, nodes
+
+        # この深さと最初の深さの文書の、たどる時間とレンダリング時間
+        funcs = [
+            lambda: walk(doc),
+            lambda: re_renderer(doc),
+            lambda: walk(base_doc),
+            lambda: re_renderer(base_doc),
+        ]
+        best = [None] * len(funcs)
+        for _ in range(repeat):
+            for k, func in enumerate(funcs):
+                elapsed = measure(func, 1)
+                if best[k] is None or elapsed < best[k]:
+                    best[k] = elapsed
+
+        # 1ノードあたりの時間と、最初の深さに対する比率
+        # 深さによらずに一定のコストでたどれれば比率はおおむね 1.0 で一定となる
+        per_node = (best[0] / nodes * 1e6, best[1] / nodes * 1e6)
+        base = (best[2] / base_nodes * 1e6, best[3] / base_nodes * 1e6)
+        ratios = []
+        for value, base_value in zip(per_node, base):
+            ratio = value / base_value
+            mark = ''
+            if ratio > threshold:
+                mark = '!'
+                ok = False
+            ratios.append('{:.2f}{}'.format(ratio, mark))
+        print('{:>10} {:>10} {:>14.3f} {:>16.3f} {:>11} {:>13}'.format(depth, nodes, *per_node, *ratios))
+
+    return ok
+
+
+# インライン解析の最悪ケースとなる行の繰り返し単位
+# ※閉じていない記号が多い行では、正規表現による照合は行の長さの２乗(リンクでは３乗)の時間がかかる
+ADVERSARIAL_INLINE_UNITS = {
+    'link': '[',
+    'link-url': '[a](',
+    'image': '![',
+    'image-title': '![a](b "',
+    'italic': '*a',
+    'bold': '**a*',
+    'under': '_',
+    'code': '` ',
+    'strike': '~~ ',
+    'emoji': ': ',
+    'comment': '<!--x',
+    'url': 'http://a',
+}
+
+# ブロック解析の最悪ケースとなる行の(前の行, 繰り返し単位)
+# ※以前の正規表現では、表のデータ行は行の長さの指数時間、画像とコメントの終了は２乗の時間がかかる
+ADVERSARIAL_BLOCK_UNITS = {
+    'table-row': ('', '| '),
+    'image-line': ('', '![a]('),
+    'comment-end': ('<!--', ' '),
+}
+
+# 差分ファジングで行を生成する文字列
+FUZZ_INLINE_TOKENS = [
+    '*', '_', '`', '~', ':', '[', ']', '(', ')', '!', '<', '>', '-', ' ', '"', 'a', '\n',
+    '**', '~~', '](', '![', '<!--', '-->', 'http://', 'https://a.b', '.', '/',
+]
+
+
+def bench_inline(sizes, fuzz, seed=0):
+    '''
+    最悪ケースの行の長さごとのインライン解析時間と、その行を含む文書の解析時間を計測
+
+    fuzz 行のランダムな短い行で、インライン要素の切り出し結果が正規表現による照合と一致することも確認する
+    一致しない行があれば False を返す
+    '''
+    md_parser = mdparser.MarkdownParser()
+
+    units = {name: ('', unit) for name, unit in ADVERSARIAL_INLINE_UNITS.items()}
+    units.update(ADVERSARIAL_BLOCK_UNITS)
+
+    print('{:>12} {:>10} {:>10} {:>10} {:>8} {:>8}'.format('pattern', 'chars', 'inline', 'parse', 'i-ratio', 'p-ratio'))
+    for name, (head, unit) in units.items():
+        bases = None
+        for size in sizes:
+            line = unit * (size // len(unit))
+            lines = [head, line] if head else [line]
+
+            # インライン解析(MarkdownParser._parse_inline)
+            start = time.perf_counter()
+            md_parser._parse_inline(line)
+            inline_sec = time.perf_counter() - start
+
+            # ブロックを含む解析(MarkdownParser.__call__)
+            start = time.perf_counter()
+            md_parser(lines)
+            parse_sec = time.perf_counter() - start
+
+            # 1文字あたりの時間の、最初の計測に対する比率
+            # 線形時間であれば比率はおおむね 1.0 で一定となる
+            per_chars = (inline_sec / len(line), parse_sec / len(line))
+            if bases is None:
+                bases = per_chars
+            print('{:>12} {:>10} {:>10.3f} {:>10.3f} {:>8.2f} {:>8.2f}'.format(
+                name, len(line), inline_sec, parse_sec, per_chars[0] / bases[0], per_chars[1] / bases[1]))
+
+    # 正規表現による照合との差分ファジング
+    # ※正規表現の照合時間が問題にならないよう、短い行のみとする
+    rand = random.Random(seed)
+    failures = 0
+    for _ in range(fuzz):
+        tokens = rand.sample(FUZZ_INLINE_TOKENS, rand.randint(2, len(FUZZ_INLINE_TOKENS)))
+        line = ''.join(rand.choice(tokens) for _ in range(rand.randint(0, 40)))
+
+        expected = []
+        for match in md_parser._regext_all.finditer(line):
+            kind, gids = md_parser._regext_kind[match.lastgroup]
+            texts = [match[gid] for gid in gids if match[gid] is not None]
+            expected.append((kind, match.start(), match.end(), texts))
+        if list(md_parser._iter_inline(line)) != expected:
+            failures += 1
+            print('{:5}: {!r}'.format('Diff', line))
+
+    print('fuzz {} lines, {} differences'.format(fuzz, failures))
+    return failures == 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+client.py
+  Request conversion of Markdown file to Re:VIEW file from server.py.
+"""
+
+
+import argparse
+import json
+import os
+import socket
+import sys
+# ※起動時間を短縮するため、変換処理のモジュールはインポートしない
+
+
+def main():
+    '''
+    メイン
+    '''
+    # 引数解析
+    parser = argparse.ArgumentParser(description='Request conversion of Markdown file to Re:VIEW file from server.py.')
+    parser.add_argument('socket_path', help='Unix domain socket path of server.py.')
+    parser.add_argument('input_path', nargs='?', help='Input File Path. (Markdown file)')
+    parser.add_argument('output_path', nargs='?', help='Output File Path. (Re:VIEW file)')
+    command = parser.add_mutually_exclusive_group()
+    command.add_argument('--stats', action='store_true', help='Print statistics of the server as JSON.')
+    command.add_argument('--shutdown', action='store_true',
+                         help='Stop the server after running conversions finish.')
+    args = parser.parse_args()
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(args.socket_path)
+        f = sock.makefile('rwb')
+
+        # 統計
+        if args.stats:
+            print(json.dumps(request(f, {'command': 'stats'}), indent=2))
+            return 0
+
+        # 終了
+        if args.shutdown:
+            request(f, {'command': 'shutdown'})
+            return 0
+
+        if args.input_path is None or args.output_path is None:
+            parser.error('input_path and output_path are required')
+
+        # ファイルはサーバーが読み書きするため絶対パスで渡す
+        response = request(f, {
+            'command': 'convert',
+            'input_path': os.path.abspath(args.input_path),
+            'output_path': os.path.abspath(args.output_path),
+        })
+
+    # pymd2re.py と同様に警告を表示する
+    print(response.get('warnings') or '', end='')
+    if response['error'] is not None:
+        print('{:5}: {}'.format('Error', response['error']))
+        return 1
+
+    return 0
+
+
+def request(f, message):
+    '''
+    要求を送信して応答を受信
+    '''
+    f.write(json.dumps(message).encode('utf-8') + b'\n')
+    f.flush()
+    line = f.readline()
+    if not line:
+        raise ConnectionError('server closed the connection')
+
+    return json.loads(line.decode('utf-8'))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
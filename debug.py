@@ -6,7 +6,7 @@ debug.py
 
 import argparse
 import mdparser
-from mdparser import Block, Inline
+import profiler
 
 
 def main():
@@ -16,31 +16,46 @@ def main():
     # 引数解析
     parser = argparse.ArgumentParser(description='Print intermidiate data to stdout.')
     parser.add_argument('input_path', help='Input File Path. (Markdown file)')
+    parser.add_argument('--profile', action='store_true',
+                        help='Print parse statistics per kind and the slowest lines.')
+    parser.add_argument('--profile-json', metavar='JSON_PATH', help='Write parse statistics to JSON file.')
+    parser.add_argument('--profile-lines', type=int, default=10,
+                        help='Number of the slowest lines in parse statistics. (default: %(default)s)')
     args = parser.parse_args()
 
-    # Markdownファイル読み込み
+    # 処理統計
+    stats = None
+    if args.profile or args.profile_json:
+        stats = profiler.ProfileStats()
+
+    # Markdownファイルを読み込みながら、確定したブロックから順に表示する
+    # ※メモリ上に保持するのは解析中のブロックの分だけとなる
+    md_parser = mdparser.MarkdownParser(stats)
     with open(args.input_path, 'r', encoding='utf-8') as f:
-        md_lines = [l.rstrip('\r\n') for l in f.readlines()]    # 改行を除去
+        md_lines = (l.rstrip('\r\n') for l in f)    # 改行を除去
 
-    # Markdown -> 文書全体ブロック
-    md_parser = mdparser.MarkdownParser()
-    md_doc = md_parser(md_lines)
+        # Markdown -> トップレベルのブロック
+        for md_block in md_parser.iter_blocks(md_lines):
+            # デバッグ用プリント
+            print(str(md_block))
+            block_print(md_block, 1)
 
-    # デバッグ用プリント
-    block_print(md_doc)
+    # 処理統計を出力
+    if args.profile:
+        print(stats.format(args.profile_lines))
+    if args.profile_json:
+        stats.dump(args.profile_json, args.profile_lines)
 
 
 def block_print(block, depth=0):
     '''
-    ブロックを再帰的に表示
+    ブロックの内部要素を表示
+
+    Block.walk() で再帰せずにたどるため、ネストの深さに制限はない
     '''
-    for subitem in block.subitems:
+    for subitem, level in block.walk():
         # ブロック・インライン要素を表示
-        print('  ' * depth + str(subitem))
-
-        if isinstance(subitem, Block):
-            # 内部を再帰的に表示
-            block_print(subitem, depth + 1)
+        print('  ' * (depth + level) + str(subitem))
 
 
 if __name__ == '__main__':
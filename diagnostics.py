@@ -0,0 +1,222 @@
+"""
+diagnostics.py
+  Collect diagnostic messages of parser and renderer.
+"""
+
+
+from enum import IntEnum, auto
+import sys
+
+
+class MessageLevel(IntEnum):
+    '''
+    列挙型：メッセージレベル
+    '''
+    DEBUG = auto()
+    INFO = auto()
+    WARNING = auto()
+    ERROR = auto()
+
+
+# メッセージレベルの表示文字列
+LEVEL_TEXTS = {
+    MessageLevel.DEBUG: 'Debug',
+    MessageLevel.INFO: 'Info ',
+    MessageLevel.WARNING: 'Warn ',
+    MessageLevel.ERROR: 'Error',
+}
+
+
+class Diagnostic:
+    '''
+    診断メッセージクラス
+    '''
+
+    __slots__ = ('level', 'linenum', 'kind', 'message', 'linenums')
+
+    def __init__(self, level, linenum, kind, message):
+        '''
+        コンストラクタ
+        '''
+        # メッセージレベル
+        self.level = level
+        # 行番号(最初に発生した行)
+        self.linenum = linenum
+        # 対象の種別名(ブロックは B:種別、インライン要素は I:種別)
+        self.kind = kind
+        # メッセージ
+        self.message = message
+        # 発生した全ての行番号(同じメッセージをまとめた場合に複数となる)
+        self.linenums = [linenum]
+
+    @property
+    def count(self):
+        '''
+        発生回数
+        '''
+        return len(self.linenums)
+
+    def to_dict(self):
+        '''
+        辞書に変換
+        '''
+        return {
+            'level': self.level.name.lower(),
+            'line': self.linenum,
+            'kind': self.kind,
+            'message': self.message,
+            'count': self.count,
+            'lines': self.linenums,
+        }
+
+
+class TextOutput:
+    '''
+    診断メッセージの出力先：テキスト
+
+    stream を省略した場合は出力時点の標準出力とする
+    '''
+
+    def __init__(self, stream=None):
+        '''
+        コンストラクタ
+        '''
+        self.stream = stream
+
+    def write(self, records):
+        '''
+        診断メッセージを出力
+        '''
+        lines = []
+        for record in records:
+            line = '{:5}: [Line={:>4}] {}'.format(LEVEL_TEXTS[record.level], record.linenum, record.message)
+            # まとめた場合は発生回数を付加
+            if record.count > 1:
+                line += ' (x{})'.format(record.count)
+            lines.append(line + '\n')
+
+        (self.stream or sys.stdout).write(''.join(lines))
+
+
+class JsonLinesOutput:
+    '''
+    診断メッセージの出力先：JSON Lines(1行に1メッセージ)
+
+    stream を省略した場合は出力時点の標準出力とする
+    '''
+
+    def __init__(self, stream=None):
+        '''
+        コンストラクタ
+        '''
+        self.stream = stream
+
+    def write(self, records):
+        '''
+        診断メッセージを出力
+        '''
+        import json
+
+        lines = [json.dumps(record.to_dict(), ensure_ascii=False) + '\n' for record in records]
+        (self.stream or sys.stdout).write(''.join(lines))
+
+
+class SilentOutput:
+    '''
+    診断メッセージの出力先：なし
+    '''
+
+    def write(self, records):
+        '''
+        診断メッセージを捨てる
+        '''
+        pass
+
+
+class CollectOutput:
+    '''
+    診断メッセージの出力先：リスト
+
+    出力された診断メッセージを records に蓄積する
+    '''
+
+    def __init__(self):
+        '''
+        コンストラクタ
+        '''
+        self.records = []
+
+    def write(self, records):
+        '''
+        診断メッセージを蓄積
+        '''
+        self.records.extend(records)
+
+
+# 出力形式の名前と出力先クラス
+OUTPUTS = {
+    'text': TextOutput,
+    'jsonl': JsonLinesOutput,
+    'silent': SilentOutput,
+}
+
+
+class DiagnosticSink:
+    '''
+    診断メッセージの収集クラス
+
+    MarkdownParser と ReviewRenderer に渡すと、診断メッセージをバッファに蓄積し、
+    flush() またはバッファが一杯になった時点でまとめて output に出力する
+    level より低いレベルのメッセージは捨てる
+    collapse が真の場合、同じレベル・種別・メッセージを発生順の最初の1件にまとめ、次の flush() まで保持する
+    '''
+
+    def __init__(self, output=None, level=MessageLevel.WARNING, collapse=False, buffer_size=1024):
+        '''
+        コンストラクタ
+        '''
+        # 出力先(省略時は標準出力へのテキスト)
+        self.output = output if output is not None else TextOutput()
+        # 出力するメッセージレベルの下限
+        self.level = level
+        # 同じメッセージをまとめるか
+        self.collapse = collapse
+        # 出力せずに蓄積するメッセージ数の上限(まとめる場合は無制限)
+        self.buffer_size = buffer_size
+
+        # 蓄積中のメッセージ
+        self._records = []
+        # まとめる場合の (レベル, 種別, メッセージ) -> 蓄積中のメッセージ
+        self._index = {}
+
+    def report(self, level, linenum, kind, message):
+        '''
+        診断メッセージを蓄積
+        '''
+        if level < self.level:
+            return
+
+        if self.collapse:
+            key = (level, kind, message)
+            record = self._index.get(key)
+            if record is not None:
+                record.linenums.append(linenum)
+                return
+            record = Diagnostic(level, linenum, kind, message)
+            self._index[key] = record
+            self._records.append(record)
+            return
+
+        self._records.append(Diagnostic(level, linenum, kind, message))
+        if len(self._records) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        '''
+        蓄積中のメッセージを出力
+        '''
+        if self._records:
+            records = self._records
+            self._records = []
+            self._index = {}
+            self.output.write(records)
@@ -4,8 +4,15 @@ mdparser.py
 """
 
 
+from array import array
 from enum import IntEnum, auto
+import gc
+from itertools import accumulate, islice
 import re
+import struct
+import sys
+import time
+from diagnostics import MessageLevel
 
 
 class Inline:
@@ -13,6 +20,9 @@ class Inline:
     インラインクラス
     '''
 
+    # 大量に生成されるためインスタンス辞書を持たない
+    __slots__ = ('kind', 'texts')
+
     class Kind(IntEnum):
         '''
         種別
@@ -49,11 +59,31 @@ class Inline:
 
         return output
 
+class _LineOrigin:
+    '''
+    行番号の原点クラス
+
+    文書全体ブロックが保持し、トップレベルのブロックの行番号はこれからの相対値とする
+    '''
+
+    __slots__ = ('linenum',)
+
+    def __init__(self):
+        '''
+        コンストラクタ
+        '''
+        # 原点の行番号
+        self.linenum = 0
+
+
 class Block:
     '''
     ブロッククラス
     '''
 
+    # 大量に生成されるためインスタンス辞書を持たない
+    __slots__ = ('kind', 'subitems', 'parent', 'level', '_linenum', '_top')
+
     class Kind(IntEnum):
         '''
         種別
@@ -89,9 +119,36 @@ class Block:
         self.parent = parent
         # レベル
         self.level = 0     # ヘッダ、引用、リストで使用する
+        # 行番号の基準：文書全体は原点、トップレベルのブロックは文書全体の原点、内部のブロックは属するトップレベルのブロック
+        # ※reparse() で行数が変わった場合に、以降のブロックを個別に更新せず原点をずらすだけで済ませるため
+        #   基準が None のブロックは行番号を絶対値で保持する(reparse() で編集位置より前のブロック)
+        if parent is None:
+            self._top = _LineOrigin()
+        elif parent.parent is None or parent.parent.parent is not None:
+            self._top = parent._top
+        else:
+            self._top = parent
         # 解析元の行番号
         self.linenum = linenum
 
+    @property
+    def linenum(self):
+        '''
+        解析元の行番号
+        '''
+        top = self._top
+        if top is None:
+            return self._linenum
+        return top.linenum + self._linenum
+
+    @linenum.setter
+    def linenum(self, value):
+        '''
+        解析元の行番号を設定
+        '''
+        top = self._top
+        self._linenum = value if top is None else value - top.linenum
+
     def __str__(self):
         '''
         テキスト化
@@ -102,6 +159,548 @@ class Block:
 
         return output
 
+    def finalize(self):
+        '''
+        内部要素を含めて確定する
+
+        サブコンテンツとインライン要素の文字列をリストからタプルに変換してメモリを削減する
+        確定後は内容を変更できない
+        '''
+        stack = [self]
+        while stack:
+            block = stack.pop()
+            for subitem in block.subitems:
+                if isinstance(subitem, Block):
+                    stack.append(subitem)
+                else:
+                    subitem.texts = tuple(subitem.texts)
+            block.subitems = tuple(block.subitems)
+
+    def walk(self, exits=False):
+        '''
+        内部要素を行きがけ順にたどるイテレータ
+
+        (要素, 深さ) を返す(このブロック自身は含まず、直下の要素の深さを 0 とする)
+        exits が真の場合、ブロックの内部要素を全て返した後に (None, そのブロックの深さ) を返す
+        再帰せずに明示的なスタックでたどるため、ネストの深さに制限はない
+        '''
+        # たどっているブロックの内部要素と次に返す要素の位置、外側のブロックのそれらのスタック
+        # ※ブロックごとにイテレータを作成すると、内部要素を全てたどるまで残るオブジェクトが深さに比例して増え、
+        #   循環ガベージコレクタが木全体を走査する回数が増えるため、位置は整数で保持する
+        items = self.subitems
+        position = 0
+        items_stack = []
+        position_stack = []
+        while True:
+            if position < len(items):
+                item = items[position]
+                position += 1
+                yield item, len(items_stack)
+                if isinstance(item, Block):
+                    # 内部要素へ進む
+                    items_stack.append(items)
+                    position_stack.append(position)
+                    items = item.subitems
+                    position = 0
+            elif items_stack:
+                # 内部要素の終わり
+                items = items_stack.pop()
+                position = position_stack.pop()
+                if exits:
+                    yield None, len(items_stack)
+            else:
+                break
+
+
+class FlatDocument:
+    '''
+    フラット文書クラス
+
+    ブロックとインライン要素の木を、行きがけ順の番号で参照する配列群として保持する
+    ノード１つあたりのオブジェクトが不要となるため、大きな文書を保持する場合に使用する
+    配列をそのままバイト列にできるため、解析結果の保存と読み込み(save() / load())にも使用する
+    '''
+
+    __slots__ = ('kinds', 'levels', 'linenums', 'ends', 'text_ends', 'texts')
+
+    # 保存形式
+    # ヘッダ(識別子, バージョン, ノード数, 文字列数, 文字列データのバイト数)に続けて
+    # kinds, levels, linenums, ends, text_ends, 文字列ごとの文字数 の配列(リトルエンディアン)と
+    # 全文字列を連結した UTF-8 のデータを格納する
+    MAGIC = b'MDTREE'
+    VERSION = 2
+    _HEADER = struct.Struct('<6sHIII')
+
+    def __init__(self):
+        '''
+        コンストラクタ
+        '''
+        # 種別(ブロックは正の値、インライン要素は符号を反転した負の値)
+        self.kinds = array('b')
+        # レベル
+        # ※見出しのレベルは # の数となり上限がないため、行番号と同じ範囲とする
+        self.levels = array('I')
+        # 解析元の行番号
+        self.linenums = array('I')
+        # 部分木の終端(次の兄弟ノードの番号)
+        self.ends = array('I')
+        # 文字列の終端(texts 内の番号)
+        # ノード i の文字列は texts[text_ends[i-1]:text_ends[i]] となる
+        self.text_ends = array('I')
+        # 全インライン要素の文字列
+        self.texts = []
+
+    def __len__(self):
+        '''
+        len()：ノード数
+        '''
+        return len(self.kinds)
+
+    @classmethod
+    def from_block(cls, block):
+        '''
+        ブロックからフラット文書を作成
+        '''
+        flat = cls()
+
+        # 行きがけ順に格納し、部分木の終端は帰りがけに設定する
+        stack = [(block, False)]
+        indexes = []
+        while stack:
+            item, closing = stack.pop()
+            if closing:
+                flat.ends[indexes.pop()] = len(flat.kinds)
+                continue
+
+            index = len(flat.kinds)
+            flat.ends.append(index + 1)
+            if isinstance(item, Block):
+                flat.kinds.append(item.kind)
+                flat.levels.append(item.level)
+                flat.linenums.append(item.linenum)
+                # 内部要素の後に終端を設定する
+                indexes.append(index)
+                stack.append((item, True))
+                stack.extend((subitem, False) for subitem in reversed(item.subitems))
+            else:
+                flat.kinds.append(-item.kind)
+                flat.levels.append(0)
+                flat.linenums.append(0)
+                flat.texts.extend(item.texts)
+            flat.text_ends.append(len(flat.texts))
+
+        return flat
+
+    def to_block(self):
+        '''
+        フラット文書からブロックを復元(確定済みとする)
+
+        作成するオブジェクトは全て木から参照されて循環参照のごみとならないため、
+        作成中は循環ガベージコレクタを停止する
+        '''
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self._to_block()
+        finally:
+            if enabled:
+                gc.enable()
+
+    def _to_block(self):
+        '''
+        フラット文書からブロックを復元
+        '''
+        block_kinds = {kind.value: kind for kind in Block.Kind}
+        inline_kinds = {-kind.value: kind for kind in Inline.Kind}
+        texts = self.texts
+
+        root = Block(block_kinds[self.kinds[0]], None, self.linenums[0])
+        root.level = self.levels[0]
+
+        # 行きがけ順に作成し、部分木の終端に達したブロックの内部要素を確定する
+        # (ブロック, 内部要素, 部分木の終端)
+        block, subitems, end = root, root.subitems, self.ends[0]
+        stack = []
+        start = self.text_ends[0]
+        nodes = zip(range(1, len(self.kinds)), self.kinds[1:], self.levels[1:], self.linenums[1:],
+                    self.ends[1:], self.text_ends[1:])
+        for index, kind, level, linenum, node_end, text_end in nodes:
+            while index >= end:
+                block.subitems = tuple(subitems)
+                block, subitems, end = stack.pop()
+
+            if kind < 0:
+                inline = Inline(inline_kinds[kind])
+                inline.texts = tuple(texts[start:text_end])
+                subitems.append(inline)
+            else:
+                child = Block(block_kinds[kind], block, linenum)
+                child.level = level
+                subitems.append(child)
+                stack.append((block, subitems, end))
+                block, subitems, end = child, child.subitems, node_end
+            start = text_end
+
+        block.subitems = tuple(subitems)
+        while stack:
+            block, subitems, _ = stack.pop()
+            block.subitems = tuple(subitems)
+
+        return root
+
+    def to_bytes(self):
+        '''
+        バイト列に変換
+        '''
+        data = ''.join(self.texts).encode('utf-8', 'surrogatepass')
+        text_lengths = array('I', map(len, self.texts))
+
+        chunks = [self._HEADER.pack(self.MAGIC, self.VERSION, len(self.kinds), len(self.texts), len(data))]
+        for values in (self.kinds, self.levels, self.linenums, self.ends, self.text_ends, text_lengths):
+            if sys.byteorder != 'little':
+                values = array(values.typecode, values)
+                values.byteswap()
+            chunks.append(values.tobytes())
+        chunks.append(data)
+
+        return b''.join(chunks)
+
+    @classmethod
+    def from_bytes(cls, data):
+        '''
+        バイト列からフラット文書を作成
+        '''
+        if len(data) < cls._HEADER.size:
+            raise ValueError('serialized document is truncated')
+        magic, version, node_count, text_count, data_size = cls._HEADER.unpack_from(data)
+        if magic != cls.MAGIC:
+            raise ValueError('not a serialized document')
+        if version != cls.VERSION:
+            raise ValueError('unsupported serialized document version: {}'.format(version))
+
+        flat = cls()
+        text_lengths = array('I')
+        view = memoryview(data)
+        offset = cls._HEADER.size
+        for values, count in ((flat.kinds, node_count), (flat.levels, node_count), (flat.linenums, node_count),
+                              (flat.ends, node_count), (flat.text_ends, node_count), (text_lengths, text_count)):
+            size = values.itemsize * count
+            if offset + size > len(data):
+                raise ValueError('serialized document is truncated')
+            values.frombytes(view[offset:offset + size])
+            if sys.byteorder != 'little':
+                values.byteswap()
+            offset += size
+        if offset + data_size != len(data):
+            raise ValueError('serialized document is truncated')
+
+        # 連結した文字列を文字数で分割する
+        text = str(view[offset:], 'utf-8', 'surrogatepass')
+        stops = accumulate(text_lengths)
+        flat.texts = [text[stop - length:stop] for stop, length in zip(stops, text_lengths)]
+
+        return flat
+
+    def save(self, path):
+        '''
+        ファイルに保存
+        '''
+        with open(path, 'wb') as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        '''
+        ファイルから読み込み
+        '''
+        with open(path, 'rb') as f:
+            return cls.from_bytes(f.read())
+
+    def children(self, index):
+        '''
+        子ノードの番号を返すイテレータ
+        '''
+        child = index + 1
+        while child < self.ends[index]:
+            yield child
+            child = self.ends[child]
+
+
+class MappedLines:
+    '''
+    メモリマップ入力行クラス
+
+    UTF-8 のファイルをメモリマップし、各行の開始位置のみを保持する
+    行は参照された時点で文字列に変換するため、全行の文字列を同時に保持しない
+    改行は open() のテキストモードと同じく \\r\\n, \\r, \\n とし、行には含めない
+
+    スライスは同じメモリマップを参照する MappedLines となる
+    pickle 化するとファイルパスと範囲のみを渡し、別プロセスで開き直す(並列パース処理に使用する)
+    '''
+
+    # 直近に変換した行を保持する数
+    RECENT_SIZE = 64
+    # イテレータでまとめて変換する行数
+    ITER_SIZE = 4096
+
+    def __init__(self, path, offset=0, size=None):
+        '''
+        コンストラクタ
+
+        offset, size を与えた場合はファイル内のその範囲(バイト数)のみを対象とする
+        '''
+        import mmap
+
+        # ファイルパス
+        self.path = path
+        with open(path, 'rb') as f:
+            # ※空のファイルはメモリマップできない
+            if f.seek(0, 2) == 0:
+                self._map = b''
+            else:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if size is None:
+            size = len(self._map) - offset
+
+        # 各行の開始位置(末尾に範囲の終端を加える)
+        # ※最後の行が改行で終わる場合、その後ろに空の行は無いものとする
+        newline = re.compile(rb'\r\n|\r|\n')
+        self._starts = array('Q', [offset])
+        self._starts.extend(match.end() for match in newline.finditer(self._map, offset, offset + size))
+        if self._starts[-1] != offset + size:
+            self._starts.append(offset + size)
+
+        # 直近に変換した行(解析中は同じ行を何度も参照するため)
+        self._recent = {}
+
+    def __enter__(self):
+        '''
+        with文：開始
+        '''
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        '''
+        with文：終了
+        '''
+        self.close()
+
+    def close(self):
+        '''
+        メモリマップを閉じる(取得済みの行の文字列は引き続き使用できる)
+        '''
+        if not isinstance(self._map, bytes):
+            self._map.close()
+
+    def update_digest(self, digest):
+        '''
+        範囲のバイト列で digest (hashlib のハッシュオブジェクト) を更新する(コピーはしない)
+        '''
+        with memoryview(self._map) as view:
+            digest.update(view[self._starts[0]:self._starts[-1]])
+
+    def __len__(self):
+        '''
+        len()：行数
+        '''
+        return len(self._starts) - 1
+
+    def __getitem__(self, i):
+        '''
+        []演算子：行を取得(スライスの場合は範囲の MappedLines を取得)
+        '''
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                raise ValueError('slice step is not supported')
+            view = MappedLines.__new__(MappedLines)
+            view.path = self.path
+            view._map = self._map
+            view._starts = self._starts[start:max(start, stop) + 1]
+            view._recent = {}
+            return view
+
+        line = self._recent.get(i)
+        if line is None:
+            if i < 0:
+                i += len(self)
+            if not 0 <= i < len(self):
+                raise IndexError('line index out of range')
+            line = str(self._map[self._starts[i]:self._starts[i+1]].rstrip(b'\r\n'), 'utf-8')
+            # 解析位置の前後の行のみ保持できればよいため、一定数を超えたら全て破棄する
+            if len(self._recent) >= self.RECENT_SIZE:
+                self._recent.clear()
+            self._recent[i] = line
+
+        return line
+
+    def __iter__(self):
+        '''
+        イテレータ：先頭から順に行を取得
+
+        一定数の行をまとめて文字列に変換し、改行で分割する
+        '''
+        newline = re.compile(r'\r\n|\r|\n')
+        for start in range(0, len(self), self.ITER_SIZE):
+            stop = min(start + self.ITER_SIZE, len(self))
+            text = str(self._map[self._starts[start]:self._starts[stop]], 'utf-8')
+            # 最後の行が改行で終わる場合は末尾に空の文字列ができる
+            yield from newline.split(text)[:stop - start]
+
+    def __reduce__(self):
+        '''
+        pickle 化：ファイルパスと範囲のみとする
+        '''
+        return MappedLines, (self.path, self._starts[0], self._starts[-1] - self._starts[0])
+
+
+class LineBuffer:
+    '''
+    行バッファクラス
+
+    入力行に 0 始まりの行番号でアクセスする
+    リストまたは MappedLines が与えられた場合はそのまま参照し、イテレータが与えられた場合は必要になった時点で読み進める
+    '''
+
+    def __init__(self, lines):
+        '''
+        コンストラクタ
+        '''
+        if isinstance(lines, (list, MappedLines)):
+            # 保持している行
+            self._lines = lines
+            # 読み込み元(全行読み込み済みであれば None)
+            self._source = None
+        else:
+            self._lines = []
+            self._source = iter(lines)
+        # 保持している先頭行の行番号
+        self._base = 0
+        # 行を破棄できるか(与えられたリストは変更しない)
+        self._releasable = self._source is not None
+
+    def __len__(self):
+        '''
+        len()：読み込み済みの行数
+        '''
+        return self._base + len(self._lines)
+
+    def __getitem__(self, i):
+        '''
+        []演算子：行を取得
+        '''
+        return self._lines[i - self._base]
+
+    def exists(self, i):
+        '''
+        指定した行が存在するか調べる（必要に応じて読み進める）
+        '''
+        while i >= len(self):
+            if self._source is None:
+                return False
+            line = next(self._source, None)
+            if line is None:
+                self._source = None
+                return False
+            self._lines.append(line)
+
+        return True
+
+    def indices(self, start):
+        '''
+        指定した行から最終行までの行番号を返すイテレータ
+        '''
+        i = start
+        while self.exists(i):
+            yield i
+            i += 1
+
+    def release(self, i):
+        '''
+        指定した行より前の行を破棄する
+        '''
+        if self._releasable and i > self._base:
+            del self._lines[:i - self._base]
+            self._base = i
+
+
+class BlockDispatcher:
+    '''
+    ブロック解析関数の振り分けクラス
+
+    行頭の文字から、その行を処理し得るブロック解析関数のみを優先順に取り出す
+    '''
+
+    def __init__(self, funcs):
+        '''
+        コンストラクタ
+
+        funcs には (関数, インデントを含む行頭の文字, インデントを除いた行頭の文字) を解析を行う順番に指定する
+        文字は候補となる文字を連結した文字列で、'0' は数字全般を表す。None は条件なしとする
+        '''
+        # ブロック解析関数と条件
+        self._funcs = funcs
+        # 条件に現れる文字(それ以外の文字は区別する必要がない)
+        self._raw_chars = ''.join(raw for _, raw, _ in funcs if raw)
+        self._lead_chars = ''.join(lead for _, _, lead in funcs if lead)
+        # 行頭の文字の組み合わせごとの関数リスト
+        self._cache = {}
+
+    def __call__(self, line):
+        '''
+        ()演算子：行を処理し得るブロック解析関数のリストを取得
+        '''
+        # インデントを含む行頭の文字
+        raw = line[:1]
+        if raw not in self._raw_chars:
+            raw = ''
+        # インデントを除いた行頭の文字
+        # ※正規表現の \s と str.lstrip() の空白文字は一致する
+        lead = line.lstrip()[:1]
+        if lead.isdecimal():
+            lead = '0'
+        elif lead not in self._lead_chars:
+            lead = ''
+
+        key = (raw, lead)
+        funcs = self._cache.get(key)
+        if funcs is None:
+            funcs = [func for func, raw_chars, lead_chars in self._funcs
+                     if (raw_chars is None or (raw and raw in raw_chars)) and
+                        (lead_chars is None or (lead and lead in lead_chars))]
+            self._cache[key] = funcs
+
+        return funcs
+
+
+class RegexTable(dict):
+    '''
+    正規表現オブジェクトの遅延コンパイルテーブル
+
+    キーごとのパターン(またはパターンのタプル)を受け取り、初めて参照されたキーのみコンパイルする
+    '''
+
+    def __init__(self, patterns):
+        '''
+        コンストラクタ
+        '''
+        super().__init__()
+        # キーごとのパターン
+        self._patterns = patterns
+
+    def __missing__(self, key):
+        '''
+        未コンパイルのキーの参照：パターンをコンパイルして登録
+        '''
+        pattern = self._patterns[key]
+        if isinstance(pattern, tuple):
+            regex = tuple(re.compile(p) for p in pattern)
+        else:
+            regex = re.compile(pattern)
+        self[key] = regex
+
+        return regex
+
 
 class MarkdownParser:
     '''
@@ -109,33 +708,70 @@ class MarkdownParser:
     '''
 
     # 定数
-    INDENT_WIDTH = 4    # インデント文字幅
-
-    def __init__(self):
+    INDENT_WIDTH = 4            # インデント文字幅
+    MIN_CHUNK_LINES = 10000     # 並列パース処理の１領域あたりの最小行数
+    MAX_RESYNC_LINES = 256      # インクリメンタルパース処理で解析し直す位置を探す最大行数
+
+    # 正規表現オブジェクト(全インスタンスで共有する)
+    _regexb = None              # ブロック
+    _regext_all = None          # インライン
+    _regext_kind = None         # インラインの名前付きグループ名に対する種別とグループ番号
+    _regext_start = None        # インライン要素の開始記号
+    _regext_url = None          # URL
+    _regext_dashes = None       # 連続する -
+    _regext_spaces = None       # 連続する半角SP
+    _regex_indent = None        # インデント
+    _regex_indent_unit = None   # 1レベル分のインデント
+    _regex_lf = None            # 改行を表す末尾の半角SP2つ
+
+    def __init__(self, stats=None, diagnostics=None):
         '''
         コンストラクタ
+
+        stats に profiler.ProfileStats を与えると処理統計を記録する
+        diagnostics に diagnostics.DiagnosticSink を与えると、解析時の情報メッセージを登録する
         '''
-        # ブロックのための正規表現オブジェクト
+        # 処理統計
+        self.stats = stats
+        # 診断メッセージの出力先
+        self.diagnostics = diagnostics
+
+        # 正規表現オブジェクトは最初のインスタンス生成時にコンパイルし、全インスタンスで共有する
+        if MarkdownParser._regexb is None:
+            MarkdownParser._compile_regex()
+
+    @classmethod
+    def _compile_regex(cls):
+        '''
+        正規表現オブジェクトをコンパイル
+        ※ブロックのための正規表現オブジェクトは、種別ごとに初回の参照時にコンパイルする
+        '''
+        # ブロックのための正規表現
         # リストに内包可能なものは先頭のインデントを許容（\s*）
-        self._regexb = {}
-        self._regexb[Block.Kind.COMMENT] = []                                                   # コメント
-        self._regexb[Block.Kind.COMMENT].append(re.compile(r'^\s*<!-{2,}(.*?)(-{2,}>)?$'))      #   [0] 開始 ※同じ行で終了する場合を考慮
-        self._regexb[Block.Kind.COMMENT].append(re.compile(r'^\s*(.*?)-{2,}>'))                 #   [1] 終了
-        self._regexb[Block.Kind.HEADER] = []                                                    # 見出し
-        self._regexb[Block.Kind.HEADER].append(re.compile(r'^(#+) (.*)'))                       #   [0] 行頭が #
-        self._regexb[Block.Kind.HEADER].append(re.compile(r'^(={3,}|-{3,})$'))                  #   [1] 次行が === ---
-        self._regexb[Block.Kind.HR] = re.compile(r'^(\*{3,}|-{3,}|_{3,})$')                     # 水平線
-        self._regexb[Block.Kind.IMAGE] = re.compile(r'^\s*!\[(.+?)\]\((.+?)( +"(.+?)")?\)$')    # 画像
-        self._regexb[Block.Kind.PRE] = re.compile(r'^ {4}(.*)$')                                # 整形済みテキスト
-        self._regexb[Block.Kind.CODE] = re.compile(r'^\s*`{3}(.*)$')                            # コード
-        self._regexb[Block.Kind.QUOTE_DATA] = re.compile(r'^\s*(>+)(.*)$')                      # 引用
-        self._regexb[Block.Kind.TABLE_ROW] = []                                                 # 表
-        self._regexb[Block.Kind.TABLE_ROW].append(re.compile(r'^\s*(\|\s*[^\|]*?\s*)+\|$'))     #   [0] データ行
-        self._regexb[Block.Kind.TABLE_ROW].append(re.compile(r'^\s*(\|\s*(:)?-+?(:)?\s*)+\|$')) #   [1] 区切り行
-        self._regexb[Block.Kind.LIST_NORMAL] = re.compile(r'^(-|\*) (.*)$')                     # 番号無しリスト
-        self._regexb[Block.Kind.LIST_ORDERED] = re.compile(r'^(\d+\.) (.*)$')                   # 番号付きリスト
-        self._regexb[Block.Kind.LIST_CHECK] = re.compile(r'^(-|\*) \[( |x|X)?\] (.*)$')         # チェックリスト
-        self._regexb[Block.Kind.PARA] = re.compile(r'^\s*(.+)$')                                # 段落
+        # ※実際に現れたブロックのものだけを初回の参照時にコンパイルする
+        restrb = {}
+        restrb[Block.Kind.COMMENT] = (                                          # コメント
+            r'^\s*<!-{2,}(.*?)(-{2,}>)?$',                                      #   [0] 開始 ※同じ行で終了する場合を考慮
+            r'^\s*(?!\s)((?:[^\n-]|-+(?![->])|(?<!-)-(?=>))*)-{2,}>',            #   [1] 終了 ※終端の -{2,}> を含まない形として後戻りを防ぐ
+        )
+        restrb[Block.Kind.HEADER] = (                                           # 見出し
+            r'^(#+) (.*)',                                                      #   [0] 行頭が #
+            r'^(={3,}|-{3,})$',                                                 #   [1] 次行が === ---
+        )
+        restrb[Block.Kind.HR] = r'^(\*{3,}|-{3,}|_{3,})$'                        # 水平線
+        restrb[Block.Kind.IMAGE] = r'^\s*!\[(?=.*\)$).+\]\(.+\)$'                # 画像 ※行末の ) を先に確かめて後戻りを防ぐ
+        restrb[Block.Kind.PRE] = r'^ {4}(.*)$'                                   # 整形済みテキスト
+        restrb[Block.Kind.CODE] = r'^\s*`{3}(.*)$'                               # コード
+        restrb[Block.Kind.QUOTE_DATA] = r'^\s*(>+)(.*)$'                         # 引用
+        restrb[Block.Kind.TABLE_ROW] = (                                        # 表
+            r'^\s*(?:\|[^|]*)+\|$',                                              #   [0] データ行 ※区切りを曖昧にせず後戻りを防ぐ
+            r'^\s*(\|\s*(:)?-+?(:)?\s*)+\|$',                                       #   [1] 区切り行
+        )
+        restrb[Block.Kind.LIST_NORMAL] = r'^(-|\*) (.*)$'                        # 番号無しリスト
+        restrb[Block.Kind.LIST_ORDERED] = r'^(\d+\.) (.*)$'                      # 番号付きリスト
+        restrb[Block.Kind.LIST_CHECK] = r'^(-|\*) \[( |x|X)?\] (.*)$'            # チェックリスト
+        restrb[Block.Kind.PARA] = r'^\s*(.+)$'                                   # 段落
+        regexb = RegexTable(restrb)
 
         # インラインのための正規表現
         restr = {}
@@ -151,30 +787,60 @@ class MarkdownParser:
         restr[Inline.Kind.IMAGE] = r'!\[(.+?)\]\((.+?)( +"(.+?)" *)?\)'             # ![xxx](yyy "zzz")
 
         # インラインのための正規表現中の、保持する可能性のあるテキストを表すグループ番号
-        self._regext_gid = {}
-        self._regext_gid[Inline.Kind.COMMENT] = (1,)        # コメント
-        self._regext_gid[Inline.Kind.ITALIC] = (1, 2)       # イタリック
-        self._regext_gid[Inline.Kind.BOLD] = (1, 2)         # ボールド
-        self._regext_gid[Inline.Kind.BOLD_ITALIC] = (1, 2)  # ボールド＆イタリック
-        self._regext_gid[Inline.Kind.CODE] = (1,)           # コード
-        self._regext_gid[Inline.Kind.STRIKE] = (1,)         # 取消線
-        self._regext_gid[Inline.Kind.EMOJI] = (1,)          # 絵文字
-        self._regext_gid[Inline.Kind.LINK] = (1, 2, 3)      # リンク
-        self._regext_gid[Inline.Kind.IMAGE] = (1, 2, 4)     # 画像
-
-        # インラインのための正規表現オブジェクト
-        self._regext = {}
-        self._regext[Inline.Kind.COMMENT] = re.compile(restr[Inline.Kind.COMMENT])          # コメント
-        self._regext[Inline.Kind.ITALIC] = re.compile(restr[Inline.Kind.ITALIC])            # イタリック
-        self._regext[Inline.Kind.BOLD] = re.compile(restr[Inline.Kind.BOLD])                # ボールド
-        self._regext[Inline.Kind.BOLD_ITALIC] = re.compile(restr[Inline.Kind.BOLD_ITALIC])  # ボールド＆イタリック
-        self._regext[Inline.Kind.CODE] = re.compile(restr[Inline.Kind.CODE])                # コード
-        self._regext[Inline.Kind.STRIKE] = re.compile(restr[Inline.Kind.STRIKE])            # 取消線
-        self._regext[Inline.Kind.EMOJI] = re.compile(restr[Inline.Kind.EMOJI])              # 絵文字
-        self._regext[Inline.Kind.LINK] = re.compile(restr[Inline.Kind.LINK])                # リンク
-        self._regext[Inline.Kind.IMAGE] = re.compile(restr[Inline.Kind.IMAGE])              # 画像
-        # インライン分割用の正規表現オブジェクト
-        self._regext_all = re.compile('|'.join(restr.values()))
+        gids = {}
+        gids[Inline.Kind.COMMENT] = (1,)        # コメント
+        gids[Inline.Kind.ITALIC] = (1, 2)       # イタリック
+        gids[Inline.Kind.BOLD] = (1, 2)         # ボールド
+        gids[Inline.Kind.BOLD_ITALIC] = (1, 2)  # ボールド＆イタリック
+        gids[Inline.Kind.CODE] = (1,)           # コード
+        gids[Inline.Kind.STRIKE] = (1,)         # 取消線
+        gids[Inline.Kind.EMOJI] = (1,)          # 絵文字
+        gids[Inline.Kind.LINK] = (1, 2, 3)      # リンク
+        gids[Inline.Kind.IMAGE] = (1, 2, 4)     # 画像
+
+        # インライン解析用の正規表現オブジェクト
+        # 種別ごとのパターンを種別名の名前付きグループで囲んで１つに結合する
+        # ※結合順が優先順位となる
+        # ※解析は同じ結果を線形時間で求める _iter_inline() で行い、これは定義と比較の基準とする
+        regext_all = re.compile('|'.join(
+            '(?P<{}>{})'.format(kind.name, pattern) for kind, pattern in restr.items()))
+
+        # 名前付きグループ名から、種別と保持するテキストのグループ番号(結合後の番号)を引く辞書
+        regext_kind = {}
+        for kind, gid in gids.items():
+            offset = regext_all.groupindex[kind.name]
+            regext_kind[kind.name] = (kind, tuple(offset + g for g in gid))
+
+        # インライン要素の開始記号のための正規表現オブジェクト(_iter_inline()で使用する)
+        regext_start = re.compile(r'[*_`:\[]|<!--|~~|!\[|https?://')
+        # URLのための正規表現オブジェクト
+        regext_url = re.compile(url)
+        # 連続する - または半角SPのための正規表現オブジェクト
+        regext_dashes = re.compile(r'-*')
+        regext_spaces = re.compile(r' *')
+
+        # インデントのための正規表現オブジェクト
+        regex_indent = re.compile(r'^(\s*)(.*?)$')
+        # 半角SPまたはタブ文字による1レベル分のインデントを表す正規表現オブジェクト
+        regex_indent_unit = re.compile(
+            r'^(' +
+            (r' ' * cls.INDENT_WIDTH) +
+            r'|\t)'
+        )
+        # 改行を表す末尾の半角SP2つのための正規表現オブジェクト
+        regex_lf = re.compile(r' {2}$')
+
+        cls._regext_all = regext_all
+        cls._regext_kind = regext_kind
+        cls._regext_start = regext_start
+        cls._regext_url = regext_url
+        cls._regext_dashes = regext_dashes
+        cls._regext_spaces = regext_spaces
+        cls._regex_indent = regex_indent
+        cls._regex_indent_unit = regex_indent_unit
+        cls._regex_lf = regex_lf
+        # 設定済みの判定に使用するため最後に設定する
+        cls._regexb = regexb
 
     def __call__(self, lines):
         '''
@@ -182,44 +848,407 @@ class MarkdownParser:
         '''
         doc = Block()
 
-        # スキップのためのインデックス：スキップなし
+        # 全ブロックを文書全体ブロックに登録したまま解析する
+        for _ in self._parse_document(doc, LineBuffer(lines), stream=False):
+            pass
+
+        doc.finalize()
+
+        return doc
+
+    def iter_blocks(self, lines):
+        '''
+        パース処理（ストリーミング）
+
+        トップレベルのブロックを確定した順に返すイテレータ
+        lines にイテレータを与えた場合、保持する行は解析中のブロックの分だけとなる
+        '''
+        doc = Block()
+
+        yield from self._parse_document(doc, LineBuffer(lines), stream=True)
+
+    def reparse(self, doc, lines, start, end, count):
+        '''
+        インクリメンタルパース処理
+
+        doc は編集前の文書を ()演算子 で解析した結果、lines は編集後の全行で、
+        編集前の行 [start, end) (0 始まり) を count 行に置き換えた編集とする
+        影響を受けるトップレベルのブロックのみ再解析して doc に差し替え、
+        再解析したブロックの doc.subitems 内の範囲を返す
+
+        ブロックの解析は後続の空行までの行を参照し得るため、編集位置より前の直近の空行を含むブロックから解析し直し、
+        編集位置より後ろで編集前のブロックの開始行と同じ状態になった時点で打ち切る
+        空行を探すのは MAX_RESYNC_LINES 行前までとし、見つからなければその行を含むブロックから解析し直す
+        行数が変わる場合、以降のブロックは文書全体の行番号の原点をずらして再利用する
+        処理時間は文書の大きさによらず、再解析する範囲と前回の編集位置からの距離(ブロック数)に比例する
+        差し替えのため、doc の直下のブロックは以降リストとして保持する
+        '''
+        return self._reparse(doc, lines, start, end, count, None)
+
+    def _reparse(self, doc, lines, start, end, count, parsed):
+        '''
+        インクリメンタルパース処理の本体
+
+        parsed が None 以外の場合、行からブロックを解析するごとにその行番号(0 始まり)を与えて呼び出す
+        '''
+        if not isinstance(doc.subitems, list):
+            doc.subitems = list(doc.subitems)
+        blocks = doc.subitems
+        delta = count - (end - start)
+        lines = LineBuffer(lines)
+
+        # 再解析を開始するブロック：編集位置より前の直近の空行を含むブロック(含むものがなければ直前のブロック)
+        # ※それより前のブロックが参照し得るのはその空行までのため、編集の影響を受けない
+        #   空行の無い長い範囲では MAX_RESYNC_LINES 行前の行を空行の代わりとする
+        #   (ブロックが自身の後ろで参照するのは次のブロックの先頭数行までのため、それより前のブロックは影響を受けない)
+        stop = max(start - self.MAX_RESYNC_LINES, 0)
+        blank = start - 1
+        while blank > stop and lines[blank] != '':
+            blank -= 1
+        first = max(self._bisect_blocks(blocks, blank + 1) - 1, 0) if blank >= 0 else 0
+        begin = blocks[first].linenum - 1 if first > 0 else 0
+
+        # 再利用を試みるブロック：編集範囲より後ろから始まるもの
+        reuse = self._bisect_blocks(blocks, end)
+
+        region = Block()
         skip = -1
+        for i in lines.indices(begin):
+            # 通過した編集前のブロックは再利用しない
+            while reuse < len(blocks) and blocks[reuse].linenum - 1 + delta < i:
+                reuse += 1
 
-        # 全行ループ
-        for i, cur_line in enumerate(lines):
             # 直前の処理でループを進めている場合はその位置までスキップ
             if i <= skip:
                 continue
 
             # 空行はスキップ
-            if len(cur_line) == 0:
+            if len(lines[i]) == 0:
                 continue
 
-            # ブロック解析のための関数リスト
-            # ※解析を行う順番に定義
-            # ※入力/出力が一致している必要あり（ダックタイピング）
-            parse_block_funcs = [
-                self._parse_block_comment,          # コメント
-                self._parse_block_header_single,    # 見出し(行頭が # のケース)
-                self._parse_block_hr,               # 水平線
-                self._parse_block_image,            # 画像
-                self._parse_block_pre,              # 整形済みテキスト
-                self._parse_block_code,             # コード
-                self._parse_block_quote,            # 引用
-                self._parse_block_table,            # 表
-                self._parse_block_list,             # リスト
-                self._parse_block_header_multiple,  # 見出し(次行が === --- のケース)
-                self._parse_block_para,             # 段落
-            ]
-
-            # ブロック解析関数を処理されるまで順に呼び出す
-            for func in parse_block_funcs:
-                done, skip = func(doc, lines, i)
-                if done:
+            # 編集前のブロックの開始行に達した場合は、以降を再利用して終了
+            # ※段落が継続する可能性がある場合は除く
+            if reuse < len(blocks) and blocks[reuse].linenum - 1 + delta == i:
+                if not (region.subitems and region.subitems[-1].kind == Block.Kind.PARA and lines[i-1] != ''):
                     break
 
+            skip = self._parse_line(region, lines, i)
+            if parsed is not None:
+                parsed(i)
+        else:
+            # 最後まで解析した
+            reuse = len(blocks)
+
+        # トップレベルのブロックは、先頭側を絶対値、末尾側を原点からの相対値とする
+        # 行数が変わる場合は再解析したブロックまでを先頭側とし、前回の編集位置との間のブロックのみ基準を付け替える
+        # ※行数が変わらない場合は付け替えず、再解析したブロックは置き換えたブロックと同じ側とする
+        origin = doc._top
+        head = self._bisect_head(blocks)
+        if delta != 0:
+            for block in islice(blocks, head, first):
+                self._set_origin(block, None)
+            for block in islice(blocks, reuse, head):
+                self._set_origin(block, origin)
+        region_origin = None if delta != 0 or head > first else origin
+
+        # 再解析したブロックを文書全体ブロックに付け替える
+        for block in region.subitems:
+            block.parent = doc
+            block.finalize()
+            self._set_origin(block, region_origin)
+
+        # 再利用するブロックの行番号を更新
+        # ※原点をずらし、文書全体ブロック自身の行番号は変えない
+        if delta != 0:
+            origin.linenum += delta
+            doc._linenum -= delta
+
+        blocks[first:reuse] = region.subitems
+
+        return range(first, first + len(region.subitems))
+
+    @staticmethod
+    def _bisect_head(blocks):
+        '''
+        ブロックのリストから、行番号を絶対値で保持する先頭側のブロックの数を二分探索で取得
+        '''
+        low = 0
+        high = len(blocks)
+        while low < high:
+            middle = (low + high) // 2
+            if blocks[middle]._top is not None:
+                high = middle
+            else:
+                low = middle + 1
+
+        return low
+
+    @staticmethod
+    def _set_origin(block, origin):
+        '''
+        トップレベルのブロックの行番号の基準を付け替える(None の場合は絶対値とする)
+        '''
+        linenum = block.linenum
+        block._top = origin
+        block.linenum = linenum
+
+    @staticmethod
+    def _bisect_blocks(blocks, linenum):
+        '''
+        ブロックのリストから、開始行番号(1 始まり)が linenum より大きい最初のブロックの番号を二分探索で取得
+        '''
+        low = 0
+        high = len(blocks)
+        while low < high:
+            middle = (low + high) // 2
+            if blocks[middle].linenum > linenum:
+                high = middle
+            else:
+                low = middle + 1
+
+        return low
+
+    def parse_parallel(self, lines, workers=None, chunk_lines=None):
+        '''
+        並列パース処理
+
+        lines を空行で区切った領域に分割し、複数のプロセスで並列に解析して連結する
+        結果と情報メッセージの順は ()演算子 と同じになる
+        lines に MappedLines を与えた場合、各プロセスには行の代わりにファイル内の範囲を渡す
+        workers はプロセス数(省略時は CPU 数)、chunk_lines は１領域あたりの目安の行数(省略時はプロセス数から決める)
+        行数が少ない場合と処理統計を記録する場合は ()演算子 で解析する
+
+        分割位置はコードやコメントの外側の空行のうち、次の行がリストや引用などの続きになり得ないものを選ぶ
+        各領域の末尾のブロックは後続の行を参照できずに解析されるため、reparse() と同様に
+        分割位置の直前のブロックから解析し直し、次の領域のブロックの開始行と同じ状態になった時点で打ち切る
+        '''
+        plan = self._plan_parallel(lines, workers, chunk_lines)
+        if plan is None:
+            return self(lines)
+
+        doc, messages = self._parse_parallel(lines, *plan)
+        for _, message in messages:
+            self.diagnostics.report(*message)
+
         return doc
 
+    def iter_parallel(self, lines, workers=None, chunk_lines=None):
+        '''
+        並列パース処理（ストリーミング）
+
+        parse_parallel() と同様に解析し、トップレベルのブロックを順に返すイテレータ
+        情報メッセージは iter_blocks() と同じく、各ブロックを返す前にそれまでに解析した行の分を登録するため、
+        ブロックごとにレンダリング時の警告を登録する場合も両者は同じ順に並ぶ
+        並列に解析しない場合は iter_blocks() で解析する
+        '''
+        plan = self._plan_parallel(lines, workers, chunk_lines)
+        if plan is None:
+            yield from self.iter_blocks(lines)
+            return
+
+        doc, messages = self._parse_parallel(lines, *plan)
+        messages = iter(messages)
+        pending = next(messages, None)
+        for index, block in enumerate(doc.subitems):
+            while pending is not None and pending[0] <= index:
+                self.diagnostics.report(*pending[1])
+                pending = next(messages, None)
+            yield block
+
+    def _plan_parallel(self, lines, workers, chunk_lines):
+        '''
+        並列パース処理のプロセス数と１領域あたりの目安の行数を決める
+
+        並列に解析しない場合は None を返す
+        '''
+        import os
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if chunk_lines is None:
+            # 処理時間をならすため、プロセス数の数倍に分割する
+            chunk_lines = max(len(lines) // (workers * 4), self.MIN_CHUNK_LINES)
+        if workers < 2 or self.stats is not None or len(lines) < chunk_lines * 2:
+            return None
+
+        return workers, chunk_lines
+
+    def _parse_parallel(self, lines, workers, chunk_lines):
+        '''
+        並列パース処理の本体
+
+        文書全体ブロックと、情報メッセージを (出力順の基準, (レベル, 行番号, 種別, メッセージ)) として
+        ()演算子 で登録される順に並べたリストを返す
+        出力順の基準は、iter_blocks() でそのメッセージより後に返されるトップレベルのブロックの最小の番号
+        '''
+        import concurrent.futures
+        import multiprocessing
+
+        # 分割位置(空行)で区切った領域ごとの開始行
+        # ※領域の末尾には分割位置の空行を含め、空行の後に行が存在しない状態と区別する
+        starts = self._split_points(lines, chunk_lines)
+        stops = [start + 1 for start in starts[1:]] + [len(lines)]
+        level = self.diagnostics.level if self.diagnostics is not None else None
+
+        # 情報メッセージは (解析していた行, その行を含むトップレベルのブロック, メッセージ) として保持する
+        records = []
+
+        # ※fork では解析済みの文書などを抱えた親プロセスのメモリが各プロセスに複製され得るため、spawn で起動する
+        context = multiprocessing.get_context('spawn')
+        # 領域ごとの解析結果を、解析の終わったものから順に行番号をずらして連結する
+        # ※連結は後続の領域の解析と並行して行う
+        doc = Block()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            results = executor.map(_parse_chunk, (lines[start:stop] for start, stop in zip(starts, stops)),
+                                   [level] * len(starts))
+            for start, (data, chunk_records) in zip(starts, results):
+                flat = FlatDocument.from_bytes(data)
+                # 行番号 0 はインライン要素と文書全体
+                flat.linenums = array('I', [linenum + start if linenum else 0 for linenum in flat.linenums])
+                blocks = flat.to_block().subitems
+                for block in blocks:
+                    block.parent = doc
+                    self._set_origin(block, doc._top)
+                doc.subitems.extend(blocks)
+                for i, msg_level, linenum, kind, message in chunk_records:
+                    owner = blocks[self._bisect_blocks(blocks, i + start + 1) - 1]
+                    records.append((i + start, owner, (msg_level, linenum + start, kind, message)))
+
+        # 分割位置の直前のブロックから解析し直す
+        # ※解析し直したブロックの情報メッセージは一旦別の出力先に登録し、解析していた行を付加する
+        diagnostics = self.diagnostics
+        parsed = None
+        if diagnostics is not None:
+            from diagnostics import CollectOutput, DiagnosticSink
+            collected = CollectOutput()
+            self.diagnostics = DiagnosticSink(collected, diagnostics.level, buffer_size=sys.maxsize)
+            stitched_records = []
+
+            def parsed(i):
+                self.diagnostics.flush()
+                stitched_records.extend((i, (record.level, record.linenum, record.kind, record.message))
+                                        for record in collected.records)
+                collected.records.clear()
+        try:
+            # 解析し直したブロックの次に再利用したブロックの開始行
+            covered = 0
+            for start in starts[1:]:
+                # 直前の分割位置から解析し直したブロックが、この分割位置を越えている場合は不要
+                if start < covered:
+                    continue
+                stitched = self._reparse(doc, lines, start + 1, start + 1, 0, parsed)
+                covered = doc.subitems[stitched.stop].linenum - 1 if stitched.stop < len(doc.subitems) else len(lines)
+                if diagnostics is not None:
+                    blocks = doc.subitems[stitched.start:stitched.stop]
+                    for i, message in stitched_records:
+                        owner = blocks[max(self._bisect_blocks(blocks, i + 1) - 1, 0)]
+                        records.append((i, owner, message))
+                    stitched_records.clear()
+        finally:
+            self.diagnostics = diagnostics
+        doc.subitems = tuple(doc.subitems)
+
+        # 解析し直さなかったブロックの情報メッセージと合わせて、解析していた行の順に並べる
+        # ※iter_blocks() は行の解析ごとに末尾以外のブロックを返すため、
+        #   ブロックを開始した行の解析中のメッセージは直前のブロックより前、継続した行の解析中のメッセージはそのブロックより前となる
+        messages = []
+        if diagnostics is not None:
+            index = {id(block): k for k, block in enumerate(doc.subitems)}
+            for i, owner, message in sorted(records, key=lambda record: record[0]):
+                k = index.get(id(owner))
+                if k is not None:
+                    messages.append((k - 1 if owner.linenum == i + 1 else k, message))
+
+        return doc, messages
+
+    @staticmethod
+    def _split_points(lines, chunk_lines):
+        '''
+        並列パース処理の分割位置を探し、先頭(0)と各分割位置の空行の行番号のリストを返す
+
+        直前の分割位置から chunk_lines 行以上離れた最初の適切な空行を分割位置とする
+        '''
+        starts = [0]
+        # コード・コメントの内側か
+        in_code = False
+        in_comment = False
+        for i, line in enumerate(lines):
+            lead = line.lstrip()[:3]
+            if in_comment:
+                in_comment = '-->' not in line
+            elif lead == '```':
+                in_code = not in_code
+            elif in_code:
+                pass
+            elif lead.startswith('<!-') and '-->' not in line:
+                in_comment = True
+            elif line == '' and i + 1 < len(lines) and i - starts[-1] >= chunk_lines:
+                # 次の行が行頭から始まり、リスト・引用・表・整形済みテキストなどの続きや見出しの下線になり得ない
+                head = lines[i+1][:1]
+                if head and head not in ' \t>|-*+_=`<!' and not head.isdecimal():
+                    starts.append(i)
+
+        return starts
+
+    def _parse_document(self, doc, lines, stream):
+        '''
+        文書全体を解析
+
+        stream が真の場合は確定したトップレベルのブロックを返し、文書全体ブロックと行バッファから破棄する
+        '''
+        # スキップのためのインデックス：スキップなし
+        skip = -1
+
+        # 全行ループ
+        for i in lines.indices(0):
+            # 直前の処理でループを進めている場合はその位置までスキップ
+            if i <= skip:
+                continue
+
+            # 空行はスキップ
+            if len(lines[i]) == 0:
+                continue
+
+            skip = self._parse_line(doc, lines, i)
+
+            # 末尾以外のブロックは確定している
+            # ※末尾の段落は次の行で継続する可能性がある
+            if stream and len(doc.subitems) > 1:
+                for block in doc.subitems[:-1]:
+                    block.finalize()
+                    yield block
+                del doc.subitems[:-1]
+                # 段落の継続判定で直前の行を参照するため、それより前の行を破棄
+                lines.release(skip)
+
+        # 残りのブロックを確定
+        if stream:
+            for block in doc.subitems:
+                block.finalize()
+                yield block
+            doc.subitems.clear()
+
+    def _parse_line(self, doc, lines, i):
+        '''
+        行から始まるトップレベルのブロックを解析し、スキップのためのインデックスを返す
+        '''
+        if self.stats is not None:
+            start = time.perf_counter()
+
+        # 行頭の文字で絞り込んだブロック解析関数を処理されるまで順に呼び出す
+        for func in self._dispatch_block(lines[i]):
+            done, skip = func(self, doc, lines, i)
+            if done:
+                break
+
+        # 処理統計：処理したブロックの種別ごとに、処理時間と解析した文字数を記録
+        if self.stats is not None:
+            elapsed = time.perf_counter() - start
+            size = sum(len(lines[j]) for j in range(i, min(skip, len(lines) - 1) + 1))
+            self.stats.add_parse(self._block_kinds[func], elapsed, size, i + 1)
+
+        return skip
+
     def _parse_block_comment(self, cur_block, lines, i):
         '''
         ブロック：コメントを解析
@@ -236,20 +1265,22 @@ class MarkdownParser:
             # 同じ行でコメントが終了してない場合
             if match.lastindex < 2:
                 # 次の行からループを進める
-                if i < len(lines) - 1:
-                    for j, sub_line in enumerate(lines[i+1:]):
+                if lines.exists(i + 1):
+                    for j in lines.indices(i + 1):
+                        sub_line = lines[j]
                         # コメント終了を見つけたらループ終了
                         match = self._regexb[Block.Kind.COMMENT][1].match(sub_line)
                         if match:
                             sub_lines.append(match[1])
                             # ループを進めた位置までスキップさせる
-                            skip = (i + 1) + j
+                            skip = j
                             break
                         # 途中の文字列は退避
-                        sub_lines.append(lines[(i + 1) + j])
+                        sub_lines.append(sub_line)
                     else:
                         # 最後までスキップ
                         skip = len(lines)
+                        self._print_info('コメントが終了していません。文書の最後までをコメントとします。', i + 1, Block.Kind.COMMENT)
 
             # ブロック作成
             block = Block(Block.Kind.COMMENT, cur_block, i + 1)
@@ -291,7 +1322,7 @@ class MarkdownParser:
         done = False
         skip = i
 
-        if i < len(lines) - 1:
+        if lines.exists(i + 1):
             # 次行をチェック
             sub_line = lines[i+1]
             match = self._regexb[Block.Kind.HEADER][1].match(sub_line)
@@ -358,12 +1389,13 @@ class MarkdownParser:
             sub_lines = []
 
             # 現在行からループを進める
-            for j, sub_line in enumerate(lines[i:]):
+            for j in lines.indices(i):
+                sub_line = lines[j]
                 # マッチしなくなったらループ終了
                 match = self._regexb[Block.Kind.PRE].match(sub_line)
                 if not match:
                     # ループを進めた位置の直前までスキップさせる
-                    skip = i + j - 1
+                    skip = j - 1
                     break
                 # 途中の文字列は退避
                 sub_lines.append(sub_line)
@@ -398,13 +1430,14 @@ class MarkdownParser:
             indent_depth, _ = self._check_indent(lines[i])
 
             # 次の行からループを進める
-            if i < len(lines) - 1:
-                for j, sub_line in enumerate(lines[i+1:]):
+            if lines.exists(i + 1):
+                for j in lines.indices(i + 1):
+                    sub_line = lines[j]
                     # ブロック終了を見つけたらループ終了
                     match = self._regexb[Block.Kind.CODE].match(sub_line)
                     if match:
                         # ループを進めた位置までスキップさせる
-                        skip = (i + 1) + j
+                        skip = j
                         break
 
                     # 途中の文字列はコードとして退避
@@ -413,6 +1446,7 @@ class MarkdownParser:
                 else:
                     # 最後までスキップ
                     skip = len(lines)
+                    self._print_info('コードが終了していません。文書の最後までをコードとします。', i + 1, Block.Kind.CODE)
 
             # ブロック作成
             block = Block(Block.Kind.CODE, cur_block, i + 1)
@@ -444,12 +1478,13 @@ class MarkdownParser:
             cur_level = 0
 
             # 現在行からループを進める
-            for j, sub_line in enumerate(lines[i:]):
+            for j in lines.indices(i):
+                sub_line = lines[j]
                 # マッチしなくなったらループ終了
                 match = self._regexb[Block.Kind.QUOTE_DATA].match(sub_line)
                 if not match:
                     # ループを進めた位置の直前までスキップさせる
-                    skip = i + j - 1
+                    skip = j - 1
                     break
 
                 # 深さ
@@ -469,7 +1504,7 @@ class MarkdownParser:
                 # 深さが +1 された場合
                 elif level - cur_level == 1:
                     # ブロック作成
-                    block = Block(Block.Kind.QUOTE_DATA, cur_block, i + j + 1)
+                    block = Block(Block.Kind.QUOTE_DATA, cur_block, j + 1)
                     block.level = level
                     # カレントブロックに登録
                     cur_block.subitems.append(block)
@@ -479,6 +1514,7 @@ class MarkdownParser:
                 # 深さが +2 以上された場合
                 else:
                     # その行は捨てる
+                    self._print_info('引用の深さが２段階以上増えています。この行は出力対象外とします。', j + 1, Block.Kind.QUOTE_DATA)
                     continue
 
                 # 深さを更新
@@ -510,19 +1546,22 @@ class MarkdownParser:
         if match:
             # ブロック作成
             block_table_top = Block(Block.Kind.TABLE_TOP, cur_block, i + 1)
+            # 列数(先頭行で確定する)
+            col_count = None
 
             # 現在行からループを進める
-            for j, sub_line in enumerate(lines[i:]):
+            for j in lines.indices(i):
+                sub_line = lines[j]
                 # マッチしなくなったらループ終了
-                idx = 1 if j == 1 else 0
+                idx = 1 if j == i + 1 else 0
                 match = self._regexb[Block.Kind.TABLE_ROW][idx].match(sub_line)
                 if not match:
                     # ループを進めた位置の直前までスキップさせる
-                    skip = i + j - 1
+                    skip = j - 1
                     break
 
                 # 区切り行の場合は次の行へ
-                if j == 1:
+                if j == i + 1:
                     continue
 
                 # 列を分割
@@ -533,19 +1572,21 @@ class MarkdownParser:
                     continue
                 cells = [c.strip() for c in cells[1:-1]]
 
-                # 全セルをインライン要素として解析
-                cell_inlines = []
-                for cell in cells:
-                    inlines = self._parse_inline(cell)
-                    cell_inlines.append(inlines)
+                # 列数に不一致があれば表ではないため、残りの行は解析せずに打ち切る
+                if col_count is None:
+                    col_count = len(cells)
+                elif len(cells) != col_count:
+                    self._print_info('表の列数が一致しません。表以外として解析します。', j + 1, Block.Kind.TABLE_TOP)
+                    block_table_top = None
+                    break
 
                 # 表の行ブロックを作成
-                kind = Block.Kind.TABLE_ROW_H if j == 0 else Block.Kind.TABLE_ROW
-                block_row = Block(kind, block_table_top, i + j + 1)
+                kind = Block.Kind.TABLE_ROW_H if j == i else Block.Kind.TABLE_ROW
+                block_row = Block(kind, block_table_top, j + 1)
                 # 行内のセルをインライン要素として解析しながら登録
                 for cell in cells:
                     # 表のセルブロックを作成
-                    block_cell = Block(Block.Kind.TABLE_CELL, block_row, i + j + 1)
+                    block_cell = Block(Block.Kind.TABLE_CELL, block_row, j + 1)
                     inlines = self._parse_inline(cell)
                     block_cell.subitems.extend(inlines)
                     # 行ブロックに連結
@@ -558,10 +1599,8 @@ class MarkdownParser:
                 # 最後までスキップ
                 skip = len(lines)
 
-            # 全行の列数をチェック
-            col_counts = [len(row.subitems) for row in block_table_top.subitems]
             # 列数に不一致がなければ
-            if len(list(set(col_counts))) == 1:
+            if block_table_top is not None:
                 # カレントブロックに登録
                 cur_block.subitems.append(block_table_top)
                 done = True
@@ -606,21 +1645,12 @@ class MarkdownParser:
             '''
             # リスト内のインデントに制限を設けないため cur_level は未使用
 
-            # ブロック解析のための関数リスト
-            # ※解析を行う順番に定義
-            # ※入力/出力が一致している必要あり（ダックタイピング）
-            parse_block_funcs = [
-                self._parse_block_comment,          # コメント
-                self._parse_block_image,            # 画像
-                self._parse_block_code,             # コード
-                self._parse_block_quote,            # 引用
-                self._parse_block_table,            # 表
-                self._parse_block_para,             # 段落
-            ]
-
-            # ブロック解析関数を処理されるまで順に呼び出す
-            for func in parse_block_funcs:
-                done, skip = func(cur_block, lines, i)
+            done = False
+            skip = i
+
+            # 行頭の文字で絞り込んだブロック解析関数を処理されるまで順に呼び出す
+            for func in self._dispatch_inner_list(lines[i]):
+                done, skip = func(self, cur_block, lines, i)
                 if done:
                     break
 
@@ -659,9 +1689,10 @@ class MarkdownParser:
             skip_j = -1
 
             # 現在行からループを進める
-            for j, sub_line in enumerate(lines[i:]):
+            for j in lines.indices(i):
                 if j <= skip_j:
                     continue
+                sub_line = lines[j]
 
                 # リストにマッチするかチェック
                 kind, level, text = match_some_list(sub_line)
@@ -673,7 +1704,7 @@ class MarkdownParser:
                             cur_block = cur_block.parent
 
                         # ブロック作成
-                        block = Block(kind, cur_block.parent, i + j + 1)
+                        block = Block(kind, cur_block.parent, j + 1)
                         block.level = level
                         # カレントブロックと同階層に登録
                         cur_block.parent.subitems.append(block)
@@ -683,7 +1714,7 @@ class MarkdownParser:
                     # 深さが同じ場合
                     elif level == cur_level:
                         # ブロック作成
-                        block = Block(kind, cur_block.parent, i + j + 1)
+                        block = Block(kind, cur_block.parent, j + 1)
                         block.level = level
                         # カレントブロックと同階層に登録
                         cur_block.parent.subitems.append(block)
@@ -693,7 +1724,7 @@ class MarkdownParser:
                     # 深さが +1 された場合
                     elif level - cur_level == 1:
                         # ブロック作成
-                        block = Block(kind, cur_block, i + j + 1)
+                        block = Block(kind, cur_block, j + 1)
                         block.level = level
                         # カレントブロックに登録
                         cur_block.subitems.append(block)
@@ -703,6 +1734,7 @@ class MarkdownParser:
                     # 深さが +2 以上された場合
                     else:
                         # その行は捨てる
+                        self._print_info('リストの深さが２段階以上増えています。この行は出力対象外とします。', j + 1, kind)
                         continue
 
                     # 深さを更新
@@ -714,10 +1746,10 @@ class MarkdownParser:
 
                 else:
                     # リストに内包可能なブロックをチェック
-                    done, skip_j = match_inner_list(cur_block, cur_level, lines, i + j)
+                    done, skip_j = match_inner_list(cur_block, cur_level, lines, j)
                     if not done:
                         # ループを進めた位置の直前までスキップさせる
-                        skip = i + j - 1
+                        skip = j - 1
                         break
             else:
                 # 最後までスキップ
@@ -767,62 +1799,226 @@ class MarkdownParser:
         インライン要素を解析
         '''
         inlines = []
-        words = []
 
         # この時点で先頭にスペースがある場合は除去する
         line = line.lstrip()
 
-        # インライン要素のワードに分割
-        # 正規表現オブジェクトのsplitではうまくいかない
-        pos = 0
-        while True:
-            match = self._regext_all.search(line, pos)
-            if match:
-                words.append(line[pos:match.start()])
-                words.append(line[match.start():match.end()])
-                pos = match.end()
-            else:
-                words.append(line[pos:])
-                break
-
-        # 空文字列を除外
-        words = [w for w in words if w]
+        # 処理統計
+        stats = self.stats
+        if stats is not None:
+            start = time.perf_counter()
 
-        # 要素をループ
-        for word in words:
-            inline = Inline()
-            # インライン種別を順に該当チェック
-            for kind, regext in self._regext.items():
-                match = regext.match(word)
-                if match:
-                    # 該当するインライン要素として格納
-                    inline.kind = kind
-
-                    # 取得するテキストのグループ番号
-                    for gid in self._regext_gid[kind]:
-                        if match[gid] is not None:
-                            inline.texts.append(match[gid])
+        # インライン要素を先頭から順に切り出す
+        pos = 0
+        for kind, begin, end, texts in self._iter_inline(line):
+            # 直前までの文字列はプレーンテキスト
+            if pos < begin:
+                inline = Inline(Inline.Kind.PLANE)
+                inline.texts.append(line[pos:begin])
+                inlines.append(inline)
+                # ※探索時間は直後のインライン要素に計上する
+                if stats is not None:
+                    stats.add_parse(Inline.Kind.PLANE, 0.0, begin - pos)
+
+            # 該当するインライン要素として格納
+            inline = Inline(kind)
+            inline.texts.extend(texts)
+            inlines.append(inline)
 
-                    break
+            if stats is not None:
+                now = time.perf_counter()
+                stats.add_parse(kind, now - start, end - begin)
+                start = now
 
-            # 該当なしの場合はプレーンテキスト
-            else:
-                inline.kind = Inline.Kind.PLANE
-                inline.texts.append(word)
+            pos = end
 
-            # インライン要素として登録
+        # 残りの文字列はプレーンテキスト
+        if pos < len(line):
+            inline = Inline(Inline.Kind.PLANE)
+            inline.texts.append(line[pos:])
             inlines.append(inline)
 
+            if stats is not None:
+                stats.add_parse(Inline.Kind.PLANE, time.perf_counter() - start, len(line) - pos)
+
         # 末尾の改行コードを解析する場合
         if has_lf and inlines:
             # 最終要素がプレーンテキストの場合は、末尾の改行チェック
             if inlines[-1].kind == Inline.Kind.PLANE:
                 # 末尾に半角SPが2つある場合は改行コードに変換する
-                if re.search(r' {2}$', inlines[-1].texts[0]):
+                if self._regex_lf.search(inlines[-1].texts[0]):
                     inlines[-1].texts[0] = inlines[-1].texts[0][:-2] + '\n'
 
         return inlines
 
+    def _iter_inline(self, line):
+        '''
+        インライン要素を先頭から順に切り出すイテレータ
+
+        (種別, 開始位置, 終了位置, 保持するテキストのリスト) を返す
+        インラインの正規表現(_regext_all)の finditer() と同じ要素を、行の長さに比例する時間で切り出す
+        ※正規表現では、閉じていない [ などの記号ごとに行末まで探索し直すため、
+          そのような記号が多い行では行の長さの２乗(リンクでは３乗)に比例する時間がかかる
+          各要素は開始記号の後で最初に現れる終了記号までとなり、探索位置は行頭から単調に進むため、
+          終了記号ごとに前回の探索結果を再利用して、同じ範囲を探索し直さない
+        '''
+        n = len(line)
+        # 探索した文字列 -> (探索開始位置, 見つかった位置)
+        found = {}
+        # 行中の改行の有無(. は改行以外に一致するため、改行を含む要素は切り出さない)
+        # ※通常の行は改行を含まないため、改行の探索を省く
+        multiline = '\n' in line
+
+        def find(sub, begin):
+            '''
+            begin 以降で最初に sub が現れる位置(ない場合は行の長さ)
+            '''
+            cache = found.get(sub)
+            if cache is not None and cache[0] <= begin <= cache[1]:
+                return cache[1]
+
+            index = line.find(sub, begin)
+            if index < 0:
+                index = n
+            found[sub] = (begin, index)
+            return index
+
+        # 画像の説明の探索結果 [探索開始位置, 終了の " の位置, ) の位置]
+        title = [n + 1, n, n]
+        spaces = self._regext_spaces.match
+
+        def find_title(begin):
+            '''
+            begin 以降で最初に、半角SPと ) が続く " が現れる位置と、その ) の位置(ない場合は行の長さ)
+            '''
+            if title[0] <= begin <= title[1]:
+                return title[1], title[2]
+
+            quote = find('"', begin)
+            close = n
+            while quote < n:
+                close = spaces(line, quote + 1).end()
+                if close < n and line[close] == ')':
+                    break
+                quote = find('"', quote + 1)
+            else:
+                close = n
+            title[:] = begin, quote, close
+            return quote, close
+
+        search = self._regext_start.search
+        dashes = self._regext_dashes.match
+        pos = 0
+        while True:
+            match = search(line, pos)
+            if match is None:
+                return
+
+            begin = match.start()
+            char = line[begin]
+            kind = None
+
+            if char == '*' or char == '_':
+                if begin + 1 < n and line[begin + 1] != char:
+                    # *xxx*
+                    end = find(char, begin + 2)
+                    if end < n:
+                        kind, texts, end = Inline.Kind.ITALIC, [line[begin + 1:end]], end + 1
+                elif line.startswith(char * 3, begin):
+                    # ***xxx***
+                    if begin + 3 < n and line[begin + 3] != char:
+                        end = find(char, begin + 4)
+                        if line.startswith(char * 3, end):
+                            kind, texts, end = Inline.Kind.BOLD_ITALIC, [line[begin + 3:end]], end + 3
+                elif begin + 2 < n:
+                    # **xxx**
+                    end = find(char, begin + 3)
+                    if line.startswith(char * 2, end):
+                        kind, texts, end = Inline.Kind.BOLD, [line[begin + 2:end]], end + 2
+
+            elif char == '`':
+                # `xxx`
+                end = find('`', begin + 2)
+                if end < (find('\n', begin + 1) if multiline else n):
+                    kind, texts, end = Inline.Kind.CODE, [line[begin + 1:end]], end + 1
+
+            elif char == '~':
+                # ~~xxx~~
+                end = find('~~', begin + 3)
+                if end < (find('\n', begin + 2) if multiline else n):
+                    kind, texts, end = Inline.Kind.STRIKE, [line[begin + 2:end]], end + 2
+
+            elif char == ':':
+                # :xxx:
+                end = find(':', begin + 2)
+                if end < (find('\n', begin + 1) if multiline else n):
+                    kind, texts, end = Inline.Kind.EMOJI, [line[begin + 1:end]], end + 1
+
+            elif char == '[':
+                # [xxx](yyy)
+                lf = find('\n', begin + 1) if multiline else n
+                bracket = find('](', begin + 2)
+                if bracket < lf:
+                    end = find(')', bracket + 3)
+                    if end < lf:
+                        kind, texts, end = Inline.Kind.LINK, [line[begin + 1:bracket], line[bracket + 2:end]], end + 1
+
+            elif char == '!':
+                # ![xxx](yyy "zzz")
+                lf = find('\n', begin + 2) if multiline else n
+                bracket = find('](', begin + 3)
+                if bracket < lf:
+                    end = find(')', bracket + 3)
+                    if end < lf:
+                        kind = Inline.Kind.IMAGE
+                        texts = [line[begin + 2:bracket], line[bracket + 2:end]]
+                        # ) より前で、半角SPの後に " が続く箇所があれば、説明の終了を探す
+                        # ※説明は ) を含むことができる
+                        space = find(' ', bracket + 3)
+                        while space < end:
+                            quote = spaces(line, space).end()
+                            if line[quote] == '"':
+                                close, paren = find_title(quote + 2)
+                                if close < lf:
+                                    texts = [line[begin + 2:bracket], line[bracket + 2:space], line[quote + 1:close]]
+                                    end = paren
+                                    break
+                            space = find(' ', quote)
+                        end += 1
+
+            elif char == '<':
+                # <!--xxx-->
+                # 開始の - の後で最初に現れる - の連続が終了となる
+                # ※開始の - が4つ以上で直後が > の場合は、開始の - の連続の後半を終了とする
+                content = dashes(line, begin + 2).end()
+                dash = find('-', content)
+                if dash < n:
+                    end = dashes(line, dash).end()
+                    if end - dash >= 2 and end < n and line[end] == '>':
+                        kind, texts, end = Inline.Kind.COMMENT, [line[content:dash]], end + 1
+                if kind is None and content - begin >= 6 and content < n and line[content] == '>':
+                    kind, texts, end = Inline.Kind.COMMENT, [''], content + 1
+
+            else:
+                # http:...
+                url = self._regext_url.match(line, begin)
+                if url is not None:
+                    kind, texts, end = Inline.Kind.LINK, [url[0]], url.end()
+
+            if kind is None:
+                pos = begin + 1
+                continue
+
+            yield kind, begin, end, texts
+            pos = end
+
+    def _print_info(self, msg, linenum, kind):
+        '''
+        情報メッセージを出力先に登録
+        '''
+        if self.diagnostics is not None:
+            self.diagnostics.report(MessageLevel.INFO, linenum, 'B:' + kind.name, msg)
+
     def _check_indent(self, text):
         '''
         文字列のインデントを調べる
@@ -832,7 +2028,7 @@ class MarkdownParser:
         deindent = text
 
         # チェック
-        match = re.match(r'^(\s*)(.*?)$', text)
+        match = self._regex_indent.match(text)
         if match:
             sp_cnt = match[1].count(' ')
             tab_cnt = match[1].count('\t')
@@ -849,17 +2045,86 @@ class MarkdownParser:
         指定した深さよりインデントが浅い場合は全インデントを削除する
         '''
 
-        # 半角SPまたはタブ文字のインデントを表す正規表現オブジェクト
-        regex_indent = re.compile(
-            r'^(' +
-            (r' ' * MarkdownParser.INDENT_WIDTH) +
-            r'|\t)'
-        )
-
         # 指定した深さの回数処理する
         for _ in range(depth):
             # 1レベル分のインデントを削除
-            text = regex_indent.sub('', text)
+            text = self._regex_indent_unit.sub('', text)
 
         return text
 
+    # ブロック解析のための関数と、処理し得る行頭の文字
+    # ※解析を行う順番に定義
+    # ※入力/出力が一致している必要あり（ダックタイピング）
+    # ※(関数, インデントを含む行頭の文字, インデントを除いた行頭の文字)  各関数の正規表現と一致させること
+    _dispatch_block = BlockDispatcher([
+        (_parse_block_comment, None, '<'),          # コメント
+        (_parse_block_header_single, '#', None),    # 見出し(行頭が # のケース)
+        (_parse_block_hr, '*-_', None),             # 水平線
+        (_parse_block_image, None, '!'),            # 画像
+        (_parse_block_pre, ' ', None),              # 整形済みテキスト
+        (_parse_block_code, None, '`'),             # コード
+        (_parse_block_quote, None, '>'),            # 引用
+        (_parse_block_table, None, '|'),            # 表
+        (_parse_block_list, None, '-*0'),           # リスト
+        (_parse_block_header_multiple, None, None), # 見出し(次行が === --- のケース)
+        (_parse_block_para, None, None),            # 段落
+    ])
+
+    # リストに内包可能なブロック解析のための関数と、処理し得る行頭の文字
+    _dispatch_inner_list = BlockDispatcher([
+        (_parse_block_comment, None, '<'),          # コメント
+        (_parse_block_image, None, '!'),            # 画像
+        (_parse_block_code, None, '`'),             # コード
+        (_parse_block_quote, None, '>'),            # 引用
+        (_parse_block_table, None, '|'),            # 表
+        (_parse_block_para, None, None),            # 段落
+    ])
+
+    # ブロック解析関数と、作成するブロックの種別(処理統計用)
+    _block_kinds = {
+        _parse_block_comment: Block.Kind.COMMENT,           # コメント
+        _parse_block_header_single: Block.Kind.HEADER,      # 見出し(行頭が # のケース)
+        _parse_block_hr: Block.Kind.HR,                     # 水平線
+        _parse_block_image: Block.Kind.IMAGE,               # 画像
+        _parse_block_pre: Block.Kind.PRE,                   # 整形済みテキスト
+        _parse_block_code: Block.Kind.CODE,                 # コード
+        _parse_block_quote: Block.Kind.QUOTE_TOP,           # 引用
+        _parse_block_table: Block.Kind.TABLE_TOP,           # 表
+        _parse_block_list: Block.Kind.LIST_TOP,             # リスト
+        _parse_block_header_multiple: Block.Kind.HEADER,    # 見出し(次行が === --- のケース)
+        _parse_block_para: Block.Kind.PARA,                 # 段落
+    }
+
+
+def _parse_chunk(lines, level):
+    '''
+    並列パース処理のワーカー：領域を解析し、保存形式のバイト列と情報メッセージのリストを返す
+
+    level が None 以外の場合、そのレベル以上の情報メッセージを
+    (解析していた行, レベル, 行番号, 種別, メッセージ) で返す
+    '''
+    from diagnostics import CollectOutput, DiagnosticSink
+
+    collected = CollectOutput()
+    sink = DiagnosticSink(collected, level, buffer_size=sys.maxsize) if level is not None else None
+    parser = MarkdownParser(diagnostics=sink)
+
+    # ()演算子 と同じ解析を行い、情報メッセージに解析していた行を付加する
+    # ※メッセージの行番号は解析を開始した行より後ろとなり得るため、所属するブロックを区別するために使用する
+    # ※MappedLines の範囲が与えられた場合は、このプロセスで領域の行のみを文字列に変換する
+    doc = Block()
+    lines = LineBuffer(list(lines))
+    records = []
+    skip = -1
+    for i in lines.indices(0):
+        if i <= skip or len(lines[i]) == 0:
+            continue
+        skip = parser._parse_line(doc, lines, i)
+        if sink is not None:
+            sink.flush()
+            records.extend((i, record.level, record.linenum, record.kind, record.message)
+                           for record in collected.records)
+            collected.records.clear()
+    doc.finalize()
+
+    return FlatDocument.from_block(doc).to_bytes(), records
@@ -0,0 +1,125 @@
+"""
+profiler.py
+  Collect processing statistics of parser and renderer.
+"""
+
+
+import heapq
+import json
+from mdparser import Inline
+
+
+class KindStats:
+    '''
+    種別ごとの統計クラス
+    '''
+
+    __slots__ = ('count', 'time', 'size')
+
+    def __init__(self):
+        '''
+        コンストラクタ
+        '''
+        # 処理回数
+        self.count = 0
+        # 累計処理時間(秒)
+        self.time = 0.0
+        # 累計文字数(解析は入力、レンダリングは出力の文字数)
+        self.size = 0
+
+
+class ProfileStats:
+    '''
+    処理統計クラス
+
+    MarkdownParser と ReviewRenderer に渡すと、ブロック・インライン要素の種別ごとの
+    処理回数・処理時間・文字数と、解析元の行番号ごとの処理時間を記録する
+    '''
+
+    def __init__(self):
+        '''
+        コンストラクタ
+        '''
+        # (処理, 種別名) ごとの統計
+        self.kinds = {}
+        # 行番号ごとの処理時間(秒)
+        # ※トップレベルのブロックの開始行に、そのブロック全体の時間を計上する
+        self.lines = {}
+
+    def add_parse(self, kind, elapsed, size, linenum=None):
+        '''
+        解析処理を記録
+        '''
+        self._add('parse', kind, elapsed, size, linenum)
+
+    def add_render(self, kind, elapsed, size, linenum=None):
+        '''
+        レンダリング処理を記録
+        '''
+        self._add('render', kind, elapsed, size, linenum)
+
+    def _add(self, phase, kind, elapsed, size, linenum):
+        '''
+        処理を記録
+        '''
+        # 種別名はブロック・インライン要素の文字列表現に合わせる
+        prefix = 'I' if isinstance(kind, Inline.Kind) else 'B'
+        key = (phase, prefix + ':' + kind.name)
+
+        stats = self.kinds.get(key)
+        if stats is None:
+            stats = KindStats()
+            self.kinds[key] = stats
+        stats.count += 1
+        stats.time += elapsed
+        stats.size += size
+
+        if linenum is not None:
+            self.lines[linenum] = self.lines.get(linenum, 0.0) + elapsed
+
+    def slowest_lines(self, n):
+        '''
+        処理時間の長い順に n 個の (行番号, 処理時間) を取得
+        '''
+        return heapq.nlargest(n, self.lines.items(), key=lambda item: item[1])
+
+    def to_dict(self, n=10):
+        '''
+        辞書に変換
+        '''
+        kinds = {}
+        for (phase, name), stats in sorted(self.kinds.items()):
+            kinds.setdefault(phase, {})[name] = {
+                'count': stats.count,
+                'time': stats.time,
+                'size': stats.size,
+            }
+
+        return {
+            'kinds': kinds,
+            'slowest_lines': [{'linenum': linenum, 'time': elapsed} for linenum, elapsed in self.slowest_lines(n)],
+        }
+
+    def dump(self, path, n=10):
+        '''
+        JSONファイルに出力
+        '''
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(n), f, indent=2)
+
+    def format(self, n=10):
+        '''
+        表形式の文字列に変換
+        '''
+        lines = []
+        lines.append('{:<7} {:<16} {:>9} {:>11} {:>11}'.format('phase', 'kind', 'count', 'time(ms)', 'size'))
+        # 処理時間の長い順
+        for (phase, name), stats in sorted(self.kinds.items(), key=lambda item: -item[1].time):
+            lines.append('{:<7} {:<16} {:>9} {:>11.3f} {:>11}'.format(phase, name, stats.count, stats.time * 1000, stats.size))
+
+        lines.append('')
+        lines.append('{:>7} {:>11}'.format('line', 'time(ms)'))
+        for linenum, elapsed in self.slowest_lines(n):
+            lines.append('{:>7} {:>11.3f}'.format(linenum, elapsed * 1000))
+
+        return '\n'.join(lines)
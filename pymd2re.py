@@ -5,19 +5,63 @@ pymd2re.py
 
 
 import argparse
-from enum import IntEnum, auto
+from collections import OrderedDict
+import contextlib
+import io
+import os
+import sys
+import time
 import mdparser
 from mdparser import Block, Inline
+import diagnostics
+from diagnostics import DiagnosticSink, MessageLevel
+# ※起動時間を短縮するため、一部のモードでのみ使用するモジュールは使用する関数内でインポートする
 
 
-class MessageLevel(IntEnum):
+def _convert_text(text, head, foot):
     '''
-    列挙型：メッセージレベル
+    テキストを出力文字列に変換
+
+    全行にヘッダとフッタを連結する
+    '''
+    if not head and not foot:
+        return text
+
+    return '\n'.join([(head + l + foot) for l in text.split('\n')])
+
+
+class _RenderFrame:
+    '''
+    レンダリング中のブロックの状態
+
+    ReviewRenderer がネストの深さごとに１つずつ作成し、ブロックをまたいで使い回す
     '''
-    DEBUG = auto()
-    INFO = auto()
-    WARNING = auto()
-    ERROR = auto()
+
+    __slots__ = ('block', 'output', 'start', 'texts', 'line_head', 'line_foot', 'block_foot', 'is_output',
+                 'start_time', 'size')
+
+    def __init__(self):
+        '''
+        コンストラクタ
+        '''
+        # 対象のブロック
+        self.block = None
+        # 出力先(出力しない場合は捨てるためのリスト)
+        self.output = None
+        # このブロックの出力開始位置
+        self.start = 0
+        # 出力していないインライン要素のテキスト
+        self.texts = []
+        # このブロック内の行のヘッダ・フッタ文字列
+        self.line_head = ''
+        self.line_foot = ''
+        # このブロックのフッタ文字列
+        self.block_foot = ''
+        # このブロックの出力可否
+        self.is_output = True
+        # 処理開始時刻と、内部ブロックを含む出力文字数(処理統計を記録する場合)
+        self.start_time = 0.0
+        self.size = 0
 
 
 class ReviewRenderer:
@@ -25,210 +69,410 @@ class ReviewRenderer:
     Re:VIEWレンダラ
     '''
 
+    # 定数
+    DEFAULT_BUFFER_SIZE = 64 * 1024     # render_to() でまとめて書き込む文字数
 
-    def __init__(self):
+    # ブロックの種別ごとの出力文字列の表(全インスタンスで共有する)
+    _BLOCK_TEXTS = None         # 種別 -> (ブロックヘッダ, 行のヘッダ, 行のフッタ, ブロックフッタ)
+    _DYNAMIC_KINDS = None       # レベルや警告によって _open_block() で処理する種別
+
+    def __init__(self, stats=None, memo_size=0, diagnostics=None):
         '''
         コンストラクタ
+
+        stats に profiler.ProfileStats を与えると処理統計を記録する
+        diagnostics に diagnostics.DiagnosticSink を与えると警告の出力先とする(省略時は標準出力)
+        memo_size に正の値を与えると、トップレベルのブロックの出力を構造が同じブロックの間で使い回す
+        (最近使用した memo_size 個のブロックの出力を保持する)
         '''
-        pass
+        # 処理統計
+        self.stats = stats
+        # 警告の出力先
+        # ※レンダリングの終了時にまとめて出力する
+        self.diagnostics = diagnostics if diagnostics is not None else DiagnosticSink()
+
+        # 種別ごとの出力文字列の表は最初のインスタンス生成時に作成し、全インスタンスで共有する
+        if ReviewRenderer._BLOCK_TEXTS is None:
+            ReviewRenderer._build_block_texts()
+
+        # 出力のメモ：ブロックの構造 -> (出力文字列, 警告のリスト)
+        self._memo = OrderedDict() if memo_size > 0 else None
+        self._memo_size = memo_size
+        self.memo_hits = 0
+        self.memo_misses = 0
+        # 記録中の警告のリスト(記録しない場合は None)
+        self._warnings = None
+        # ネストの深さごとのレンダリング中のブロックの状態
+        self._frames = []
+
+    @classmethod
+    def _build_block_texts(cls):
+        '''
+        種別ごとの出力文字列の表を作成
+        '''
+        # ブロックの種別ごとの (ブロックヘッダ, 行のヘッダ, 行のフッタ, ブロックフッタ) の文字列
+        # ※レベルや警告によって変わるものは _open_block() で置き換える
+        block_texts = {
+            Block.Kind.DOCUMENT: ('', '', '', ''),
+            Block.Kind.COMMENT: ('', '#@# ', '', '\n'),
+            Block.Kind.HEADER: ('', '', '', '\n\n'),
+            Block.Kind.HR: ('', '', '', '\n\n'),
+            Block.Kind.IMAGE: ('', '', '', '\n\n'),
+            Block.Kind.PRE: ('//emlist{\n', '', '', '\n//}\n\n'),
+            Block.Kind.CODE: ('//emlist{\n', '', '', '\n//}\n\n'),
+            Block.Kind.QUOTE_TOP: ('', '', '', '\n'),
+            Block.Kind.QUOTE_DATA: ('//quote{\n', '', '\n', '//}\n\n'),
+            Block.Kind.TABLE_TOP: ('//table[][]{\n', '', '', '//}\n\n'),
+            Block.Kind.TABLE_ROW: ('', '', '', '\n'),
+            Block.Kind.TABLE_ROW_H: ('', '', '', '\n------\n'),
+            Block.Kind.TABLE_CELL: ('', '', '\t', ''),
+            Block.Kind.LIST_TOP: ('', '', '', '\n'),
+            Block.Kind.LIST_NORMAL: ('', '', '\n', ''),
+            Block.Kind.LIST_ORDERED: ('1. ', '', '\n', ''),
+            Block.Kind.LIST_CHECK: ('', '', '\n', ''),
+            Block.Kind.PARA: ('', '', '', '\n\n'),
+        }
+        # レベルや警告によって _open_block() で処理するブロックの種別
+        cls._DYNAMIC_KINDS = frozenset((
+            Block.Kind.HEADER,
+            Block.Kind.HR,
+            Block.Kind.QUOTE_DATA,
+            Block.Kind.LIST_NORMAL,
+            Block.Kind.LIST_ORDERED,
+            Block.Kind.LIST_CHECK,
+        ))
+        # 設定済みの判定に使用するため最後に設定する
+        cls._BLOCK_TEXTS = block_texts
 
     def __call__(self, doc):
         '''
         ()演算子：レンダリング処理
+
+        文書全体(DOCUMENT)以外のブロックを与えた場合は、そのブロック自身を内部要素も含めてレンダリングする
         '''
+        # 文書全体はトップレベルのブロックを順にレンダリングする(文書全体のヘッダ・フッタは無い)
+        blocks = doc.subitems if doc.kind == Block.Kind.DOCUMENT else (doc,)
 
-        # レンダリング
-        output = self._render_block(doc)
+        # 全体を１回で書き込む
+        stream = io.StringIO()
+        self.render_to(blocks, stream, sys.maxsize)
 
-        return output
+        return stream.getvalue()
+
+    def render_to(self, blocks, stream, buffer_size=DEFAULT_BUFFER_SIZE):
+        '''
+        トップレベルのブロックを順にレンダリングし、stream (書き込み可能なテキストストリーム) に書き込む
+
+        出力文字列の断片が buffer_size 文字以上たまるごとに連結して書き込むため、出力全体を同時に保持しない
+        buffer_size に 0 を与えるとブロックごとに書き込む
+        MarkdownParser.iter_blocks() と組み合わせてストリーミング変換を行う
+        書き込んだ文字数を返す
+        '''
+        written = 0
+        output = []
+        # 書き込んでいない文字数
+        pending = 0
+        try:
+            for block in blocks:
+                start = len(output)
+                self._render_top_block(block, output)
+                pending += sum(len(fragment) for fragment in output[start:])
+
+                if pending >= buffer_size:
+                    written += stream.write(''.join(output))
+                    output.clear()
+                    pending = 0
+
+            if output:
+                written += stream.write(''.join(output))
+        finally:
+            self.diagnostics.flush()
+
+        return written
+
+    def iter_render(self, blocks):
+        '''
+        トップレベルのブロックを順にレンダリングして返すイテレータ
+
+        MarkdownParser.iter_blocks() と組み合わせてストリーミング変換を行う
+        '''
+        try:
+            for block in blocks:
+                output = []
+                self._render_top_block(block, output)
+                yield ''.join(output)
+        finally:
+            self.diagnostics.flush()
+
+    def memo_info(self):
+        '''
+        出力のメモの統計を取得
+        '''
+        return {
+            'hits': self.memo_hits,
+            'misses': self.memo_misses,
+            'size': len(self._memo) if self._memo is not None else 0,
+            'max_size': self._memo_size,
+        }
+
+    def _render_top_block(self, block, output):
+        '''
+        トップレベルのブロックをレンダリング
 
-    def _render_block(self, block):
+        メモが有効な場合、構造が同じブロックをレンダリング済みであれば出力を再利用する
+        警告は行番号をこのブロックの開始行からの相対値として記録し、再利用時に改めて表示する
         '''
-        ブロックを再帰的にレンダリング
+        if self._memo is None:
+            self._render_block(block, output)
+            return
+
+        if self.stats is not None:
+            start_time = time.perf_counter()
+
+        key = self._memo_key(block, block.linenum)
+        entry = self._memo.get(key)
+
+        # 再利用
+        if entry is not None:
+            self._memo.move_to_end(key)
+            self.memo_hits += 1
+            text, warnings = entry
+            for msg, level, offset, kind in warnings:
+                self._print_error(msg, level, block.linenum + offset, kind)
+            output.append(text)
+
+            # 処理統計：レンダリングした場合と同様にブロックの処理時間と出力文字数を記録
+            if self.stats is not None:
+                self.stats.add_render(block.kind, time.perf_counter() - start_time, len(text), block.linenum)
+            return
+
+        # レンダリングして警告とともに記録
+        self.memo_misses += 1
+        self._warnings = []
+        start = len(output)
+        try:
+            self._render_block(block, output)
+        finally:
+            warnings = [(msg, level, linenum - block.linenum, kind) for msg, level, linenum, kind in self._warnings]
+            self._warnings = None
+
+        self._memo[key] = (''.join(output[start:]), warnings)
+        # 最も使用されていないものから削除
+        if len(self._memo) > self._memo_size:
+            self._memo.popitem(last=False)
+
+    def _memo_key(self, block, base):
+        '''
+        メモのキーとするブロックの構造を取得
+
+        内部要素を含めた種別・レベル・開始行からの相対行番号・文字列のタプルとする
+        '''
+        # たどっている途中のブロックと、その内部要素のキーのスタック
+        blocks = [block]
+        items = [[]]
+        for subitem, _ in block.walk(exits=True):
+            # ブロックの内部要素の終わり
+            if subitem is None:
+                subitem = blocks.pop()
+                key = (subitem.kind, subitem.level, subitem.linenum - base, tuple(items.pop()))
+                items[-1].append(key)
+            # ブロック：内部要素のキーを集める
+            elif isinstance(subitem, Block):
+                blocks.append(subitem)
+                items.append([])
+            # インライン
+            else:
+                # ※finalize() していない木の文字列はリストのため、タプルに変換する
+                items[-1].append((subitem.kind, tuple(subitem.texts)))
+
+        return (block.kind, block.level, block.linenum - base, tuple(items[0]))
+
+    def _render_block(self, block, output):
+        '''
+        ブロックを内部要素も含めてレンダリング
+
+        出力文字列の断片を output (リスト) の末尾に追加していく
+        内部ブロックも同じリストに追加するため、各文字列のコピーは最後の連結時の１回で済む
+        Block.walk() でたどり、レンダリング中のブロックの状態をネストの深さごとに保持するため、ネストの深さに制限はない
         '''
         # 出力文字列は明示的に改行コード(\n)を格納すること
-        output = ''
 
-        # このブロックのヘッダ文字列
-        block_head = ''
-        # このブロック内の行のヘッダ文字列
-        line_head = ''
-        # このブロック内の行のフッタ文字列
-        line_foot = ''
-        # このブロックの降った文字列
-        block_foot = ''
-        # このブロックの出力可否
-        is_output = True
+        # レンダリング中のブロックの状態(添字はこのブロックを 0 とする深さ)
+        # ※ブロックごとに作成すると、内部ブロックを全てレンダリングするまで残るオブジェクトが深さに比例して増え、
+        #   循環ガベージコレクタが木全体を走査する回数が増えるため、作成済みのものを使い回す
+        frames = self._frames
+        self._open_block(block, output, 0)
+        for subitem, depth in block.walk(exits=True):
+            frame = frames[depth]
 
-        # 文書全体
-        if block.kind == Block.Kind.DOCUMENT:
-            pass
+            # ブロックの内部要素の終わり
+            if subitem is None:
+                self._close_block(frames[depth + 1], frame)
 
-        # コメント
-        elif block.kind == Block.Kind.COMMENT:
-            line_head = '#@# '
-            block_foot = '\n'
+            # ブロック
+            elif isinstance(subitem, Block):
+                # ここまでのテキストを出力
+                if frame.texts:
+                    self._output_texts(frame)
+
+                # 内部ブロックへ進む
+                self._open_block(subitem, frame.output, depth + 1)
+
+            # インライン
+            else:
+                # インライン要素をレンダリングしてテキストを保持
+                frame.texts.append(self._render_inline(subitem, frame.block.linenum))
+
+        self._close_block(frames[0], None)
+
+    def _open_block(self, block, output, depth):
+        '''
+        ブロックのレンダリングを開始
+
+        ネストの深さ depth のレンダリング中の状態を初期化し、ブロックヘッダを出力する
+        '''
+        if depth == len(self._frames):
+            self._frames.append(_RenderFrame())
+        frame = self._frames[depth]
+        frame.block = block
+        frame.output = output
+        frame.is_output = True
+        if self.stats is not None:
+            frame.start_time = time.perf_counter()
+            frame.size = 0
+
+        kind = block.kind
+        block_head, frame.line_head, frame.line_foot, frame.block_foot = self._BLOCK_TEXTS[kind]
+
+        # 種別ごとの文字列が固定のブロック
+        if kind not in self._DYNAMIC_KINDS:
+            pass
 
         # 見出し
-        elif block.kind == Block.Kind.HEADER:
+        elif kind == Block.Kind.HEADER:
             level = block.level
             if level >= 6:
                 level = 5
                 # 警告
-                self._print_error('６段階以上の見出しは使用できません。５段階目として出力します。', MessageLevel.WARNING, block.linenum)
+                self._print_error('６段階以上の見出しは使用できません。５段階目として出力します。', MessageLevel.WARNING, block.linenum, kind)
 
             block_head = '=' * level + ' '
-            block_foot = '\n\n'
 
         # 水平線
-        elif block.kind == Block.Kind.HR:
-            is_output = False
+        elif kind == Block.Kind.HR:
+            frame.is_output = False
             # 警告
-            self._print_error('水平線は使用できません。出力対象外とします。', MessageLevel.WARNING, block.linenum)
-            block_foot = '\n\n'
-
-        # 画像
-        elif block.kind == Block.Kind.IMAGE:
-            block_foot = '\n\n'
-
-        # 整形済みテキスト
-        elif block.kind == Block.Kind.PRE:
-            block_head = '//emlist{\n'
-            block_foot = '\n//}\n\n'
-
-        # コード
-        elif block.kind == Block.Kind.CODE:
-            block_head = '//emlist{\n'
-            block_foot = '\n//}\n\n'
-
-        # 引用(データ先頭)
-        elif block.kind == Block.Kind.QUOTE_TOP:
-            block_foot = '\n'
+            self._print_error('水平線は使用できません。出力対象外とします。', MessageLevel.WARNING, block.linenum, kind)
 
         # 引用
-        elif block.kind == Block.Kind.QUOTE_DATA:
+        elif kind == Block.Kind.QUOTE_DATA:
             if block.level >= 2:
                 # 警告
-                self._print_error('２段階以上の引用は使用できません。１段階目の内容の一部として出力します。', MessageLevel.WARNING, block.linenum)
-            else:
-                block_head = '//quote{\n'
-                block_foot = '//}\n\n'
-            line_foot = '\n'
-
-        # 表(データ先頭)
-        elif block.kind == Block.Kind.TABLE_TOP:
-            block_head = '//table[][]{\n'
-            block_foot = '//}\n\n'
-
-        # 表の行
-        elif block.kind == Block.Kind.TABLE_ROW:
-            block_foot = '\n'
-
-        # 表のヘッダ行
-        elif block.kind == Block.Kind.TABLE_ROW_H:
-            block_foot = '\n------\n'
-
-        # 表のセル
-        elif block.kind == Block.Kind.TABLE_CELL:
-            line_foot = '\t'
-
-        # リスト(データ先頭)
-        elif block.kind == Block.Kind.LIST_TOP:
-            block_foot = '\n'
+                self._print_error('２段階以上の引用は使用できません。１段階目の内容の一部として出力します。', MessageLevel.WARNING, block.linenum, kind)
+                block_head = ''
+                frame.block_foot = ''
 
         # 番号無しリスト
-        elif block.kind == Block.Kind.LIST_NORMAL:
+        elif kind == Block.Kind.LIST_NORMAL:
             block_head = '*' * block.level + ' '
-            line_foot = '\n'
 
         # 番号付きリスト
-        elif block.kind == Block.Kind.LIST_ORDERED:
+        elif kind == Block.Kind.LIST_ORDERED:
             if block.level >= 2:
-                is_output = False
+                frame.is_output = False
                 # 警告
-                self._print_error('番号付きリストのネストは使用できません。出力対象外とします。', MessageLevel.WARNING, block.linenum)
-            else:
-                block_head = '1. '
-            line_foot = '\n'
+                self._print_error('番号付きリストのネストは使用できません。出力対象外とします。', MessageLevel.WARNING, block.linenum, kind)
 
         # チェックリスト
-        elif block.kind == Block.Kind.LIST_CHECK:
+        elif kind == Block.Kind.LIST_CHECK:
             block_head = '*' * block.level + ' '
             # 警告
-            self._print_error('チェックリストは使用できません。番号無しリストとして出力します。', MessageLevel.WARNING, block.linenum)
-            line_foot = '\n'
-
-        # 段落
-        elif block.kind == Block.Kind.PARA:
-            block_foot = '\n\n'
-
-        def convert_text(text, head, foot):
-            '''
-            テキストを出力文字列に変換
-            '''
-            # テキストを行に分割
-            lines = text.split('\n')
-            # 全行にヘッダとフッタを連結
-            lines = [(head + l + foot) for l in lines]
-            # １つのテキストに戻す
-            text = '\n'.join(lines)
-
-            return text
+            self._print_error('チェックリストは使用できません。番号無しリストとして出力します。', MessageLevel.WARNING, block.linenum, kind)
 
-        # ブロックヘッダを出力
-        output += block_head
-
-        text = None
+        # 出力しない場合も警告のために内部はレンダリングし、結果は捨てる
+        if not frame.is_output:
+            frame.output = []
+        # このブロックの出力開始位置
+        frame.start = len(frame.output)
 
-        # 内部要素をループ
-        for subitem in block.subitems:
-            # ブロック
-            if isinstance(subitem, Block):
-                # ここまでのテキストを出力
-                if text is not None:
-                    output += convert_text(text, line_head, line_foot)
-                    text = None
+        # ブロックヘッダを出力
+        self._output(frame, block_head)
 
-                # 内部ブロックを再帰的にレンダリング
-                output += self._render_block(subitem)
+    def _close_block(self, frame, parent):
+        '''
+        ブロックのレンダリングを終了
 
-            # インライン
-            elif isinstance(subitem, Inline):
-                # インライン要素をレンダリングしてテキストを保持
-                text_buf = self._render_inline(subitem, block.linenum)
-                if text is not None:
-                    text += text_buf
-                else:
-                    text = text_buf
+        残りのテキストとブロックフッタを出力する
+        parent は外側のブロックのレンダリング中の状態(無い場合は None)
+        '''
+        block = frame.block
+        output = frame.output
+        start = frame.start
 
         # ここまでのテキストを出力
-        if text is not None:
-            output += convert_text(text, line_head, line_foot)
-            text = None
+        if frame.texts:
+            self._output_texts(frame)
 
         # 特定のブロック処理
         if block.kind == Block.Kind.TABLE_ROW or \
            block.kind == Block.Kind.TABLE_ROW_H:
             # TABLE_CELL の処理で入れた末尾のタブ文字を削除
-            output = output.rstrip('\t')
+            # ※末尾の断片から順に削除し、行全体は連結しない
+            while len(output) > start:
+                fragment = output[-1].rstrip('\t')
+                frame.size -= len(output[-1]) - len(fragment)
+                output[-1] = fragment
+                if fragment:
+                    break
+                output.pop()
         elif block.kind == Block.Kind.TABLE_CELL:
             # 空文字列は . とする
-            if not output:
-                output = '.'
+            # ※出力全体の先頭から数えずに、このブロックの断片のみを調べる
+            if not any(output[i] for i in range(start, len(output))):
+                self._output(frame, '.')
 
         # ブロックフッタを出力
-        output += block_foot
-
-        # 出力文字列を確定
-        if not is_output:
-            output = ''
+        self._output(frame, frame.block_foot)
+
+        # 処理統計：内部ブロックを含む処理時間と出力文字数を記録
+        # ※出力文字数は同じ出力先の外側のブロックに加算する
+        if self.stats is not None:
+            elapsed = time.perf_counter() - frame.start_time
+            size = frame.size if frame.is_output else 0
+            if parent is not None and parent.output is output:
+                parent.size += frame.size
+            # トップレベルのブロックは開始行の処理時間としても記録
+            linenum = None
+            if block.parent is not None and block.parent.kind == Block.Kind.DOCUMENT:
+                linenum = block.linenum
+            self.stats.add_render(block.kind, elapsed, size, linenum)
+
+        # 使い回すまでブロックと出力先を参照し続けないようにする
+        frame.block = None
+        frame.output = None
+
+    def _output_texts(self, frame):
+        '''
+        保持しているインライン要素のテキストを行のヘッダ・フッタとともに出力
+        '''
+        self._output(frame, _convert_text(''.join(frame.texts), frame.line_head, frame.line_foot))
+        frame.texts.clear()
 
-        return output
+    def _output(self, frame, fragment):
+        '''
+        出力文字列の断片を出力
+        '''
+        frame.output.append(fragment)
+        if self.stats is not None:
+            frame.size += len(fragment)
 
     def _render_inline(self, inline, linenum):
         '''
         インライン要素をレンダリング
         '''
+        if self.stats is not None:
+            start_time = time.perf_counter()
+
         output = ''
 
         # プレーンテキスト
@@ -238,7 +482,7 @@ class ReviewRenderer:
         # コメント
         elif inline.kind == Inline.Kind.COMMENT:
             # 警告
-            self._print_error('インラインコメントは使用できません。出力対象外とします。', MessageLevel.WARNING, linenum)
+            self._print_error('インラインコメントは使用できません。出力対象外とします。', MessageLevel.WARNING, linenum, inline.kind)
 
         # イタリック
         elif inline.kind == Inline.Kind.ITALIC:
@@ -252,7 +496,7 @@ class ReviewRenderer:
         elif inline.kind == Inline.Kind.BOLD_ITALIC:
             output = '@<b>{' + inline.texts[0] + '}'
             # 警告
-            self._print_error('ボールド＆イタリックは使用できません。ボールドで出力します。', MessageLevel.WARNING, linenum)
+            self._print_error('ボールド＆イタリックは使用できません。ボールドで出力します。', MessageLevel.WARNING, linenum, inline.kind)
 
         # コード
         elif inline.kind == Inline.Kind.CODE:
@@ -262,12 +506,12 @@ class ReviewRenderer:
         elif inline.kind == Inline.Kind.STRIKE:
             output = inline.texts[0]
             # 警告
-            self._print_error('取消線は使用できません。プレーンテキストで出力します。', MessageLevel.WARNING, linenum)
+            self._print_error('取消線は使用できません。プレーンテキストで出力します。', MessageLevel.WARNING, linenum, inline.kind)
 
         # 絵文字
         elif inline.kind == Inline.Kind.EMOJI:
             # 警告
-            self._print_error('絵文字は使用できません。出力対象外とします。', MessageLevel.WARNING, linenum)
+            self._print_error('絵文字は使用できません。出力対象外とします。', MessageLevel.WARNING, linenum, inline.kind)
 
         # リンク
         elif inline.kind == Inline.Kind.LINK:
@@ -284,25 +528,195 @@ class ReviewRenderer:
                 output += '//image[%s]{\n' % (inline.texts[0])
             output += '//}'
 
+        # 処理統計
+        if self.stats is not None:
+            self.stats.add_render(inline.kind, time.perf_counter() - start_time, len(output))
+
         return output
 
-    def _print_error(self, msg, level, linenum):
+    def _print_error(self, msg, level, linenum, kind):
+        '''
+        エラーメッセージを出力先に登録
+        '''
+        # 出力のメモのために記録
+        if self._warnings is not None:
+            self._warnings.append((msg, level, linenum, kind))
+
+        # 種別名はブロック・インライン要素の文字列表現に合わせる
+        prefix = 'I' if isinstance(kind, Inline.Kind) else 'B'
+        self.diagnostics.report(level, linenum, prefix + ':' + kind.name, msg)
+
+
+class ConversionCache:
+    '''
+    変換結果キャッシュ
+
+    入力ファイルの内容とパーサー/レンダラのバージョンから求めたハッシュをキーとして、
+    変換結果(Re:VIEWファイル)と警告をディレクトリに保存する
+    '''
+
+    # 定数
+    DEFAULT_MAX_SIZE = 256 * 1024 * 1024    # キャッシュの最大サイズ(byte)
+
+    def __init__(self, cache_dir=None, max_size=DEFAULT_MAX_SIZE, variant=''):
+        '''
+        コンストラクタ
+
+        cache_dir を省略した場合はユーザーのキャッシュディレクトリ内の pymd2re とする
+        '''
+        # キャッシュディレクトリ
+        self.cache_dir = cache_dir if cache_dir is not None else self.default_dir()
+        # キャッシュの最大サイズ(byte)
+        self.max_size = max_size
+        # パーサー/レンダラのバージョン
+        # ※ソースコードと変換の設定(variant)のハッシュとし、変更があれば以前のキャッシュは使用しない
+        self._stamp = self._hash_files([mdparser.__file__, diagnostics.__file__, __file__], variant)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def default_dir():
+        '''
+        既定のキャッシュディレクトリを取得
+
+        作業ディレクトリにファイルを作らないよう、ユーザーのキャッシュディレクトリ内とする
+        '''
+        if os.name == 'nt':
+            base = os.environ.get('LOCALAPPDATA') or os.path.expanduser(os.path.join('~', 'AppData', 'Local'))
+        elif sys.platform == 'darwin':
+            base = os.path.expanduser(os.path.join('~', 'Library', 'Caches'))
+        else:
+            base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser(os.path.join('~', '.cache'))
+
+        return os.path.join(base, 'pymd2re')
+
+    def key(self, input_path):
+        '''
+        入力ファイルに対するキーを取得
+        '''
+        return self._hash_files([input_path], self._stamp)
+
+    def hasher(self):
+        '''
+        キーを求めるハッシュオブジェクトを取得
+
+        入力ファイルの内容を update() で与え、hexdigest() をキーとする(key() と同じ値となる)
+        '''
+        import hashlib
+
+        return hashlib.sha256(self._stamp.encode('utf-8'))
+
+    def load(self, key, output_path):
+        '''
+        キャッシュから変換結果を出力ファイルに書き込み、警告を返す
+        キャッシュが存在しない場合は None を返す
+        '''
+        import shutil
+
+        re_path, log_path = self._entry_paths(key)
+        try:
+            with open(log_path, 'r', encoding='utf-8') as f:
+                warnings = f.read()
+        except FileNotFoundError:
+            return None
+
+        # コピーの途中で中断した場合に書きかけの出力ファイルが残らないよう、一時ファイルにコピーしてから置き換える
+        tmp_path = _temp_output_path(output_path)
+        try:
+            shutil.copyfile(re_path, tmp_path)
+            if tmp_path != output_path:
+                os.replace(tmp_path, output_path)
+        except BaseException as e:
+            if tmp_path != output_path:
+                with contextlib.suppress(OSError):
+                    os.remove(tmp_path)
+            # 変換結果ファイルが削除されていた場合はエントリが無いものとする
+            if isinstance(e, FileNotFoundError):
+                return None
+            raise
+        # 最近使用したエントリとして削除の優先度を下げる
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(re_path)
+
+        return warnings
+
+    def store(self, key, output_path, warnings):
+        '''
+        変換結果と警告をキャッシュに保存する
+        '''
+        import shutil
+        import tempfile
+
+        re_path, log_path = self._entry_paths(key)
+
+        # 並列に変換している他のプロセスから書き込み途中のファイルが見えないよう、一時ファイルから置き換える
+        # ※警告ファイルの有無をエントリの有無とするため、変換結果を先に置く
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir)
+        try:
+            os.close(fd)
+            shutil.copyfile(output_path, tmp_path)
+            os.replace(tmp_path, re_path)
+
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir)
+            with open(fd, 'w', encoding='utf-8') as f:
+                f.write(warnings)
+            os.replace(tmp_path, log_path)
+        except OSError:
+            # 書き込めなかった一時ファイルを残さない
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+            raise
+
+        self._evict()
+
+    def _entry_paths(self, key):
+        '''
+        エントリの変換結果ファイルと警告ファイルのパスを取得
+        '''
+        path = os.path.join(self.cache_dir, key)
+        return path + '.re', path + '.log'
+
+    def _evict(self):
         '''
-        エラーメッセージを表示
+        最大サイズを超えている場合は使用されていない順にエントリを削除する
         '''
-        # メッセージレベル
-        ltext = ''
-        if level == MessageLevel.DEBUG:
-            ltext = 'Debug'
-        elif level == MessageLevel.INFO:
-            ltext = 'Info '
-        elif level == MessageLevel.WARNING:
-            ltext = 'Warn '
-        elif level == MessageLevel.ERROR:
-            ltext = 'Error'
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith('.re'):
+                continue
+            try:
+                stat = entry.stat()
+                size = stat.st_size + os.path.getsize(entry.path[:-len('.re')] + '.log')
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, size, entry.path[:-len('.re')]))
+            total += size
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            for ext in ('.log', '.re'):
+                try:
+                    os.remove(path + ext)
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+    @staticmethod
+    def _hash_files(paths, salt=''):
+        '''
+        ファイルの内容のハッシュを取得
+        '''
+        import hashlib
 
-        # 表示
-        print('{:5}: [Line={:>4}] {}'.format(ltext, linenum, msg))
+        h = hashlib.sha256(salt.encode('utf-8'))
+        for path in paths:
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    h.update(chunk)
+
+        return h.hexdigest()
 
 
 def main():
@@ -311,27 +725,450 @@ def main():
     '''
     # 引数解析
     parser = argparse.ArgumentParser(description='Convert Markdown file to Re:VIEW file.')
-    parser.add_argument('input_path', help='Input File Path. (Markdown file)')
-    parser.add_argument('output_path', help='Output File Path. (Re:VIEW file)')
+    parser.add_argument('input_path', nargs='+',
+                        help='Input File Path. (Markdown file) '
+                             'In batch mode, directories, glob patterns and @manifest files are also accepted.')
+    parser.add_argument('output_path', help='Output File Path. (Re:VIEW file) In batch mode, output directory.')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('-b', '--batch', action='store_true', help='Convert multiple files in parallel.')
+    mode.add_argument('-w', '--watch', action='store_true',
+                      help='Keep converting modified files, as in batch mode, until interrupted.')
+    parser.add_argument('--interval', type=float, default=0.5,
+                        help='Polling interval in seconds in watch mode. (default: %(default)s)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Number of worker processes in batch mode or with --parallel-parse. (default: number of CPUs)')
+    parser.add_argument('--parallel-parse', action='store_true',
+                        help='Split a single large file at blank lines and parse the parts in parallel.')
+    add_conversion_arguments(parser)
+    parser.add_argument('--profile', action='store_true',
+                        help='Print processing statistics per kind and the slowest lines. (single file only, no cache)')
+    parser.add_argument('--profile-json', metavar='JSON_PATH',
+                        help='Write processing statistics to JSON file. (single file only, no cache)')
+    parser.add_argument('--profile-lines', type=int, default=10,
+                        help='Number of the slowest lines in processing statistics. (default: %(default)s)')
     #parser.add_argument('-s', '--starter', action='store_true', help='Use Re:VIEW Stareter Extentions.')   # 未対応
     args = parser.parse_args()
 
-    # Markdownファイル読み込み
-    with open(args.input_path, 'r', encoding='utf-8') as f:
-        md_lines = [l.rstrip('\r\n') for l in f.readlines()]    # 改行を除去
+    # 処理統計
+    stats = None
+    if args.profile or args.profile_json:
+        if args.batch or args.watch:
+            parser.error('--profile and --profile-json are not allowed with --batch or --watch')
+        import profiler
+        stats = profiler.ProfileStats()
+
+    # 並列パース
+    if args.parallel_parse and (args.batch or args.watch):
+        parser.error('--parallel-parse is not allowed with --batch or --watch')
+
+    # 警告の出力先
+    sink = create_sink(args)
+
+    # 変換結果キャッシュ
+    # ※処理統計を記録する場合は必ず変換する
+    cache = create_cache(args) if stats is None else None
+
+    # 監視モード
+    if args.watch:
+        return watch(args.input_path, args.output_path, args.interval, cache, args.memo_size, sink)
+
+    # バッチモード
+    if args.batch:
+        try:
+            jobs = collect_batch_jobs(args.input_path, args.output_path)
+        except ValueError as e:
+            print('{:5}: {}'.format('Error', e))
+            return 1
+        if not jobs:
+            print('{:5}: {}'.format('Error', 'no input files'))
+            return 1
+        return convert_batch(jobs, args.jobs, cache, args.memo_size, sink)
+
+    if len(args.input_path) != 1:
+        parser.error('only one input_path is allowed without --batch')
+    parse_workers = (args.jobs or os.cpu_count() or 1) if args.parallel_parse else None
+
+    md_parser = mdparser.MarkdownParser(stats, sink)
+    re_renderer = ReviewRenderer(stats, args.memo_size, sink)
+    convert_file(md_parser, re_renderer, args.input_path[0], args.output_path, cache, parse_workers)
+
+    # 処理統計を出力
+    if args.profile:
+        print(stats.format(args.profile_lines))
+        if args.memo_size > 0:
+            print()
+            print('memo: hits={hits} misses={misses} size={size}/{max_size}'.format(**re_renderer.memo_info()))
+    if args.profile_json:
+        stats.dump(args.profile_json, args.profile_lines)
+
+    return 0
+
+
+def add_conversion_arguments(parser):
+    '''
+    変換結果キャッシュ・出力のメモ・警告の出力先の引数を追加
+
+    変換サーバー(server.py)と共通の引数とする
+    '''
+    parser.add_argument('--no-cache', action='store_true', help='Do not use the conversion cache.')
+    parser.add_argument('--cache-dir', default=None,
+                        help='Conversion cache directory. (default: pymd2re in the user cache directory)')
+    parser.add_argument('--cache-size', type=int, default=ConversionCache.DEFAULT_MAX_SIZE // (1024 * 1024),
+                        help='Maximum size of the conversion cache in MB. (default: %(default)s)')
+    parser.add_argument('--memo-size', type=int, default=0,
+                        help='Number of rendered top-level blocks kept for reuse by identical blocks. '
+                             'Useful for documents that repeat the same tables or paragraphs. (default: %(default)s, disabled)')
+    parser.add_argument('--diagnostics', choices=list(diagnostics.OUTPUTS), default='text',
+                        help='Output format of warnings. (default: %(default)s)')
+    parser.add_argument('--diagnostics-level', choices=[level.name.lower() for level in MessageLevel], default='warning',
+                        help='Lowest level of printed messages. "info" adds notes from the parser. (default: %(default)s)')
+    parser.add_argument('--collapse-diagnostics', action='store_true',
+                        help='Print identical messages of a file once with their count.')
+
+
+def create_sink(args):
+    '''
+    引数に従って警告の出力先を作成
+    '''
+    return DiagnosticSink(diagnostics.OUTPUTS[args.diagnostics](), MessageLevel[args.diagnostics_level.upper()],
+                          args.collapse_diagnostics)
+
+
+def create_cache(args):
+    '''
+    引数に従って変換結果キャッシュを作成(使用しない場合は None)
+
+    警告の出力形式ごとに別のエントリとする
+    '''
+    if args.no_cache:
+        return None
 
-    # Markdown -> 文書全体ブロック
-    md_parser = mdparser.MarkdownParser()
-    md_doc = md_parser(md_lines)
+    variant = '{} {} {}'.format(args.diagnostics, args.diagnostics_level, args.collapse_diagnostics)
+    try:
+        return ConversionCache(args.cache_dir, args.cache_size * 1024 * 1024, variant)
+    except OSError as e:
+        # キャッシュディレクトリが書き込み不可の場合などは、キャッシュを使用せずに変換する
+        _print_cache_warning(e)
+        return None
 
-    # 文書ブロック -> Re:VIEW
-    re_renderer = ReviewRenderer()
-    re_lines = re_renderer(md_doc)
 
-    # Re:VIEWファイル書き込み
-    with open(args.output_path, 'w', encoding='utf-8') as f:
-        f.write(re_lines)
+def _print_cache_warning(error):
+    '''
+    変換結果キャッシュのエラーを警告として表示
+
+    変換の警告の出力形式(--diagnostics)によらず、標準エラー出力に表示する
+    '''
+    print('{:5}: conversion cache is not used: {}'.format('Warn', error), file=sys.stderr)
+
+
+def convert_file(md_parser, re_renderer, input_path, output_path, cache=None, parse_workers=None):
+    '''
+    MarkdownファイルをRe:VIEWファイルに変換
+
+    キャッシュが与えられた場合、入力ファイルに変更がなければ変換せずキャッシュの内容を出力する
+    parse_workers を与えた場合、そのプロセス数で並列にパースする
+    '''
+    if cache is None:
+        _convert_file(md_parser, re_renderer, input_path, output_path, parse_workers)
+        return
+
+    # ※キャッシュの読み書きに失敗した場合は警告を表示し、キャッシュを使用せずに変換する
+    #   入力ファイルを読み込めない場合は、変換時のエラーとして報告する
+    try:
+        key = cache.key(input_path)
+    except OSError:
+        _convert_file(md_parser, re_renderer, input_path, output_path, parse_workers)
+        return
+
+    try:
+        warnings = cache.load(key, output_path)
+    except OSError as e:
+        _print_cache_warning(e)
+        warnings = None
+
+    if warnings is None:
+        # 警告を保存するため、変換中の表示を取得する
+        # ※キーを求めた後に入力ファイルが更新された場合に備え、変換した内容のハッシュをキーとして保存する
+        stdout = io.StringIO()
+        digest = cache.hasher()
+        with contextlib.redirect_stdout(stdout):
+            _convert_file(md_parser, re_renderer, input_path, output_path, parse_workers, digest)
+        warnings = stdout.getvalue()
+        key = digest.hexdigest()
+        try:
+            cache.store(key, output_path, warnings)
+        except OSError as e:
+            _print_cache_warning(e)
+
+    print(warnings, end='')
+
+
+def _convert_file(md_parser, re_renderer, input_path, output_path, parse_workers=None, digest=None):
+    '''
+    MarkdownファイルをRe:VIEWファイルに変換(キャッシュ不使用)
+
+    digest (hashlib のハッシュオブジェクト) を与えた場合、変換した入力ファイルの内容で更新する
+    '''
+    # 入力の途中で読み込みに失敗した場合に書きかけの出力ファイルが残らないよう、
+    # 出力先と同じディレクトリの一時ファイルに書き込み、レンダリングが終わってから置き換える
+    tmp_path = _temp_output_path(output_path)
+
+    try:
+        # Markdownファイルを読み込みながら、確定したブロックから順に変換して書き込む
+        # ※メモリ上に保持するのは解析中のブロックの分だけとなる
+        # ※並列にパースする場合はファイルをメモリマップし、各プロセスで担当する範囲の行のみを読み込む
+        with contextlib.ExitStack() as stack:
+            # Markdown -> トップレベルのブロック
+            if parse_workers is None:
+                if digest is None:
+                    f_in = stack.enter_context(open(input_path, 'r', encoding='utf-8'))
+                else:
+                    # 読み込んだバイト列をハッシュに与えてからテキストに変換する
+                    f_raw = stack.enter_context(open(input_path, 'rb', buffering=0))
+                    f_in = stack.enter_context(io.TextIOWrapper(io.BufferedReader(_HashingReader(f_raw, digest)),
+                                                                encoding='utf-8'))
+                md_lines = (l.rstrip('\r\n') for l in f_in)    # 改行を除去
+                md_blocks = md_parser.iter_blocks(md_lines)
+            else:
+                # ※行数が少なく並列に解析しない場合は、レンダリング中に行を読み込む
+                md_lines = stack.enter_context(mdparser.MappedLines(input_path))
+                if digest is not None:
+                    md_lines.update_digest(digest)
+                md_blocks = md_parser.iter_parallel(md_lines, parse_workers)
+
+            # ブロック -> Re:VIEW
+            f_out = stack.enter_context(open(tmp_path, 'w', encoding='utf-8'))
+            re_renderer.render_to(md_blocks, f_out)
+    except BaseException:
+        if tmp_path != output_path:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+        raise
+
+    if tmp_path != output_path:
+        os.replace(tmp_path, output_path)
+
+
+def _temp_output_path(output_path):
+    '''
+    出力ファイルを置き換えるための一時ファイルのパスを取得
+
+    デバイスなど通常のファイル以外への出力は直接書き込むため、output_path をそのまま返す
+    '''
+    if os.path.exists(output_path) and not os.path.isfile(output_path):
+        return output_path
+
+    out_dir, out_name = os.path.split(output_path)
+    return os.path.join(out_dir, '.{}.{}.tmp'.format(out_name, os.getpid()))
+
+
+class _HashingReader(io.RawIOBase):
+    '''
+    読み込んだバイト列でハッシュを更新する入力ストリーム
+    '''
+
+    def __init__(self, raw, digest):
+        '''
+        コンストラクタ
+        '''
+        # 読み込み元(バイナリモードのファイル)
+        self._raw = raw
+        # 更新するハッシュオブジェクト
+        self._digest = digest
+
+    def readable(self):
+        '''
+        読み込み可能か
+        '''
+        return True
+
+    def readinto(self, b):
+        '''
+        b に読み込み、読み込んだバイト数を返す
+        '''
+        n = self._raw.readinto(b)
+        if n:
+            self._digest.update(memoryview(b)[:n])
+        return n
+
+
+def collect_batch_jobs(input_paths, output_dir):
+    '''
+    バッチモードの入力パスを展開し、(入力ファイル, 出力ファイル) のリストを作成
+
+    ディレクトリは直下の *.md、@で始まるパスはマニフェスト(1行1パス)として展開する
+    '''
+    import glob
+
+    md_paths = []
+    for path in input_paths:
+        # マニフェスト
+        if path.startswith('@'):
+            manifest_path = path[1:]
+            base_dir = os.path.dirname(manifest_path)
+            # ※読み込めない場合は入力パスの誤りとしてエラーとする(監視モードでは次のポーリングで再試行する)
+            try:
+                with open(manifest_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        line = line.strip()
+                        # 空行とコメント行は無視
+                        if line and not line.startswith('#'):
+                            md_paths.append(os.path.join(base_dir, line))
+            except (OSError, UnicodeError) as e:
+                raise ValueError('cannot read manifest {}: {}'.format(manifest_path, e)) from e
+        # ディレクトリ
+        elif os.path.isdir(path):
+            md_paths.extend(sorted(glob.glob(os.path.join(path, '*.md'))))
+        # ファイル または globパターン
+        else:
+            # 該当なしの場合はそのまま渡し、変換時のエラーとして報告する
+            md_paths.extend(sorted(glob.glob(path, recursive=True)) or [path])
+
+    # 出力ファイルは入力ファイル名の拡張子を .re にしたもの
+    # ※異なるディレクトリの同名の入力ファイルは同じ出力ファイルとなり、並列に書き込まれて一方が失われるためエラーとする
+    #   同じ入力ファイルが重複して指定された場合は１回だけ変換する
+    jobs = []
+    inputs = {}
+    conflicts = []
+    for md_path in md_paths:
+        name = os.path.splitext(os.path.basename(md_path))[0] + '.re'
+        output_path = os.path.join(output_dir, name)
+        real_path = os.path.realpath(md_path)
+        if output_path in inputs:
+            if inputs[output_path][1] != real_path:
+                conflicts.append('{} and {} -> {}'.format(inputs[output_path][0], md_path, output_path))
+            continue
+        inputs[output_path] = (md_path, real_path)
+        jobs.append((md_path, output_path))
+
+    if conflicts:
+        raise ValueError('input files with the same name are written to the same output file: ' + ', '.join(conflicts))
+
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+    except OSError as e:
+        raise ValueError('cannot create output directory {}: {}'.format(output_dir, e)) from e
+    return jobs
+
+
+# ワーカープロセスで使い回すパーサーとレンダラ、変換結果キャッシュ
+_worker_parser = None
+_worker_renderer = None
+_worker_cache = None
+
+
+def _init_worker(cache, memo_size=0, sink=None):
+    '''
+    ワーカープロセスの初期化
+    '''
+    global _worker_parser, _worker_renderer, _worker_cache
+    _worker_parser = mdparser.MarkdownParser(diagnostics=sink)
+    _worker_renderer = ReviewRenderer(memo_size=memo_size, diagnostics=sink)
+    _worker_cache = cache
+
+
+def _convert_in_worker(job):
+    '''
+    ワーカープロセスでの変換処理
+
+    警告の表示順がファイル間で混ざらないよう、標準出力を取得して呼び出し元へ返す
+    '''
+    input_path, output_path = job
+    stdout = io.StringIO()
+    error = None
+
+    try:
+        with contextlib.redirect_stdout(stdout):
+            convert_file(_worker_parser, _worker_renderer, input_path, output_path, _worker_cache)
+    except (OSError, UnicodeError) as e:
+        error = str(e)
+    except Exception as e:
+        # パーサー/レンダラの不具合などでも、残りのファイルの変換を続ける
+        error = '{}: {}'.format(type(e).__name__, e)
+
+    return stdout.getvalue(), error
+
+
+def convert_batch(jobs, workers=None, cache=None, memo_size=0, sink=None):
+    '''
+    複数ファイルをプロセスプールで並列に変換
+
+    警告は入力順にファイル単位でまとめて表示し、1ファイルでも失敗した場合は 1 を返す
+    '''
+    import concurrent.futures
+
+    status = 0
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                initargs=(cache, memo_size, sink)) as executor:
+        # 結果は入力順に返る
+        for (input_path, _), (warnings, error) in zip(jobs, executor.map(_convert_in_worker, jobs)):
+            if warnings or error:
+                print('{}:'.format(input_path))
+                print(warnings, end='')
+            if error:
+                print('{:5}: {}'.format('Error', error))
+                status = 1
+
+    return status
+
+
+def watch(input_paths, output_dir, interval, cache=None, memo_size=0, sink=None):
+    '''
+    入力ファイルの更新を監視し、更新されたファイルのみ変換する
+
+    パーサーとレンダラは使い回し、更新の検出は更新日時のポーリングで行う
+    入力パスはバッチモードと同じ形式で、ポーリングのたびに展開するため追加されたファイルも対象となる
+    '''
+    md_parser = mdparser.MarkdownParser(diagnostics=sink)
+    re_renderer = ReviewRenderer(memo_size=memo_size, diagnostics=sink)
+
+    # 変換済みファイルの更新日時
+    mtimes = {}
+    # 直前に表示した入力パスの展開のエラー
+    last_error = None
+
+    try:
+        while True:
+            # 出力ファイルが重複する場合は、解消されるまで変換しない(同じエラーは１回だけ表示する)
+            try:
+                jobs = collect_batch_jobs(input_paths, output_dir)
+            except ValueError as e:
+                if str(e) != last_error:
+                    print('{:5}: {}'.format('Error', e))
+                    sys.stdout.flush()
+                    last_error = str(e)
+                jobs = []
+            else:
+                last_error = None
+
+            for input_path, output_path in jobs:
+                try:
+                    mtime = os.stat(input_path).st_mtime_ns
+                except OSError:
+                    continue
+                # 更新されていなければスキップ
+                if mtimes.get(input_path) == mtime:
+                    continue
+                mtimes[input_path] = mtime
+
+                # 変換したファイルの警告のみ表示
+                print('{}:'.format(input_path))
+                try:
+                    convert_file(md_parser, re_renderer, input_path, output_path, cache)
+                except (OSError, UnicodeError) as e:
+                    print('{:5}: {}'.format('Error', e))
+                except Exception as e:
+                    # パーサー/レンダラの不具合などでも監視を続ける
+                    print('{:5}: {}: {}'.format('Error', type(e).__name__, e))
+                sys.stdout.flush()
+
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+    return 0
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,373 @@
+"""
+server.py
+  Convert Markdown files to Re:VIEW files on requests through a Unix domain socket.
+"""
+
+
+import argparse
+import asyncio
+from collections import deque
+import concurrent.futures
+import contextlib
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import stat
+import sys
+import time
+import mdparser
+import pymd2re
+from diagnostics import DiagnosticSink, SilentOutput
+
+
+# ワーカープロセスの起動時に変換する文書
+# ※ブロックの正規表現は種別ごとに初回の参照時にコンパイルするため、全種類のブロックを含める
+WARM_UP_LINES = [
+    '<!-- comment -->',
+    '# header',
+    'header',
+    '===',
+    '***',
+    '![image](image.png "caption")',
+    '    pre',
+    '```',
+    'code',
+    '```',
+    '> quote',
+    '| a | b |',
+    '|---|---|',
+    '| *c* | **d** |',
+    '- list',
+    '1. ordered',
+    '- [ ] check',
+    'para `code` ~~strike~~ :emoji: [link](url)',
+]
+
+
+def main():
+    '''
+    メイン
+    '''
+    # 引数解析
+    parser = argparse.ArgumentParser(description='Convert Markdown files to Re:VIEW files on requests through a Unix domain socket.')
+    parser.add_argument('socket_path', help='Unix domain socket path to listen on.')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Number of worker processes. (default: number of CPUs)')
+    pymd2re.add_conversion_arguments(parser)
+    args = parser.parse_args()
+
+    server = ConversionServer(args.socket_path, args.jobs, pymd2re.create_cache(args), args.memo_size,
+                              pymd2re.create_sink(args))
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+
+    return 0
+
+
+class ServerStats:
+    '''
+    変換サーバーの統計クラス
+    '''
+
+    # 定数
+    WINDOW_SEC = 60             # スループットを求める期間(秒)
+    LATENCY_COUNT = 1000        # 応答時間の分布を求める直近の変換数
+
+    def __init__(self, workers):
+        '''
+        コンストラクタ
+        '''
+        # ワーカープロセス数
+        self.workers = workers
+        # 開始時刻
+        self.start_time = time.time()
+        # 受け付けた変換数
+        self.requests = 0
+        # 完了した変換数(失敗を含む)
+        self.completed = 0
+        # 失敗した変換数
+        self.failed = 0
+        # 実行中または待機中の変換数
+        self.in_flight = 0
+        # 待機中の変換数の最大値
+        self.max_queued = 0
+        # 直近 WINDOW_SEC 秒間に完了した変換の完了時刻
+        self._done_times = deque()
+        # 直近の変換の (待機時間, 変換時間) (秒)
+        self._latencies = deque(maxlen=self.LATENCY_COUNT)
+
+    @property
+    def queued(self):
+        '''
+        ワーカープロセスの空きを待っている変換数
+        '''
+        return max(0, self.in_flight - self.workers)
+
+    def submit(self):
+        '''
+        変換の受け付けを記録
+        '''
+        self.requests += 1
+        self.in_flight += 1
+        self.max_queued = max(self.max_queued, self.queued)
+
+    def done(self, queue_sec, convert_sec, failed):
+        '''
+        変換の完了を記録
+        '''
+        self.in_flight -= 1
+        self.completed += 1
+        if failed:
+            self.failed += 1
+
+        now = time.time()
+        self._done_times.append(now)
+        self._expire(now)
+        self._latencies.append((queue_sec, convert_sec))
+
+    def _expire(self, now):
+        '''
+        スループットを求める期間外の完了時刻を削除
+        '''
+        while self._done_times and self._done_times[0] < now - self.WINDOW_SEC:
+            self._done_times.popleft()
+
+    def to_dict(self):
+        '''
+        辞書に変換
+        '''
+        now = time.time()
+        self._expire(now)
+        uptime = now - self.start_time
+
+        def percentile(values, ratio):
+            '''
+            昇順に並べた値の分位数
+            '''
+            if not values:
+                return 0.0
+            return values[min(len(values) - 1, int(len(values) * ratio))]
+
+        queue_secs = sorted(queue_sec for queue_sec, _ in self._latencies)
+        convert_secs = sorted(convert_sec for _, convert_sec in self._latencies)
+        return {
+            'workers': self.workers,
+            'uptime': uptime,
+            'requests': self.requests,
+            'completed': self.completed,
+            'failed': self.failed,
+            'in_flight': self.in_flight,
+            'queued': self.queued,
+            'max_queued': self.max_queued,
+            # 1秒あたりの完了数(直近 WINDOW_SEC 秒間、開始から)
+            'throughput': len(self._done_times) / min(uptime, self.WINDOW_SEC) if uptime > 0 else 0.0,
+            'throughput_total': self.completed / uptime if uptime > 0 else 0.0,
+            # 直近 LATENCY_COUNT 件の待機時間・変換時間(秒)
+            'queue_time_p50': percentile(queue_secs, 0.5),
+            'queue_time_p95': percentile(queue_secs, 0.95),
+            'convert_time_p50': percentile(convert_secs, 0.5),
+            'convert_time_p95': percentile(convert_secs, 0.95),
+        }
+
+
+class ConversionServer:
+    '''
+    変換サーバー
+
+    Unix ドメインソケットで変換の要求を受け付け、パーサーとレンダラを生成済みのワーカープロセスで変換する
+    要求と応答は1行1つの JSON とし、1つの接続で複数の要求を順に処理する
+      {"command": "convert", "input_path": 入力ファイル, "output_path": 出力ファイル}
+        -> {"warnings": 警告の表示, "error": エラー(成功時は null), "queue_time": 待機時間, "convert_time": 変換時間}
+      {"command": "stats"} -> ServerStats.to_dict()
+      {"command": "shutdown"} -> {"error": null} (実行中の変換が終わってから終了する)
+    ファイルはサーバーが読み書きするため、パスは絶対パスとすること
+    '''
+
+    def __init__(self, socket_path, workers=None, cache=None, memo_size=0, sink=None):
+        '''
+        コンストラクタ
+        '''
+        # 待ち受けるソケットのパス
+        self.socket_path = socket_path
+        # ワーカープロセス数
+        self.workers = workers or os.cpu_count() or 1
+        # ワーカープロセスの初期化引数
+        self._initargs = (cache, memo_size, sink)
+        # 統計
+        self.stats = ServerStats(self.workers)
+
+        # ワーカープロセスのプール
+        self._executor = None
+        # 終了の指示
+        self._stopping = None
+        # 実行中の変換がないこと
+        self._idle = None
+        # 接続中のクライアントの処理タスク -> 書き込み先
+        self._connections = {}
+
+    async def serve(self):
+        '''
+        終了の指示を受けるまで要求を処理する
+        '''
+        self._check_socket()
+        self._stopping = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, self._stopping.set)
+
+        # イベントループのスレッドを持つプロセスを複製しないよう、ワーカープロセスは新しいインタプリタで起動する
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers, initializer=_init_server_worker,
+                                                    initargs=self._initargs,
+                                                    mp_context=multiprocessing.get_context('spawn')) as executor:
+            self._executor = executor
+            # 全てのワーカープロセスを起動し、初期化が終わるまで待つ
+            await asyncio.gather(*[loop.run_in_executor(executor, os.getpid) for _ in range(self.workers)])
+
+            server = await asyncio.start_unix_server(self._handle, self.socket_path)
+            print('Listening on {} with {} workers'.format(self.socket_path, self.workers))
+            sys.stdout.flush()
+            try:
+                await self._stopping.wait()
+            finally:
+                # 新しい接続の受け付けを止め、実行中の変換の応答を返してから接続を閉じる
+                server.close()
+                # ※ソケットが既に削除されている場合は無視する
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(self.socket_path)
+                await self._idle.wait()
+                for writer in self._connections.values():
+                    writer.close()
+                await asyncio.gather(*self._connections, return_exceptions=True)
+                await server.wait_closed()
+
+    def _check_socket(self):
+        '''
+        ソケットのパスが使用可能か確認する
+
+        前回のサーバーが残したソケットは削除し、起動中のサーバーがあればエラーとする
+        ソケット以外のファイルは削除せずにエラーとする
+        '''
+        if not os.path.exists(self.socket_path):
+            return
+
+        if not stat.S_ISSOCK(os.stat(self.socket_path).st_mode):
+            raise OSError('not a socket: {}'.format(self.socket_path))
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(self.socket_path)
+            except ConnectionRefusedError:
+                os.unlink(self.socket_path)
+                return
+
+        raise OSError('server is already running on {}'.format(self.socket_path))
+
+    async def _handle(self, reader, writer):
+        '''
+        1つの接続の要求を順に処理する
+        '''
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                # ※ワーカープロセスの異常終了(BrokenProcessPool)なども、接続を切らずにエラーとして応答する
+                try:
+                    request = json.loads(line.decode('utf-8'))
+                    response = await self._dispatch(request)
+                except (ValueError, TypeError, KeyError) as e:
+                    response = {'error': 'invalid request: {}'.format(e)}
+                except asyncio.CancelledError:
+                    # ※Python 3.7 では Exception の派生クラスのため、先に除外する
+                    raise
+                except Exception as e:
+                    response = {'error': 'conversion failed: {}: {}'.format(type(e).__name__, e)}
+
+                writer.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            del self._connections[task]
+            writer.close()
+
+    async def _dispatch(self, request):
+        '''
+        要求を処理して応答を返す
+        '''
+        command = request['command']
+
+        # 変換
+        if command == 'convert':
+            return await self._convert(request['input_path'], request['output_path'])
+
+        # 統計
+        if command == 'stats':
+            return self.stats.to_dict()
+
+        # 終了
+        if command == 'shutdown':
+            self._stopping.set()
+            return {'error': None}
+
+        raise ValueError('unknown command {!r}'.format(command))
+
+    async def _convert(self, input_path, output_path):
+        '''
+        ワーカープロセスで変換する
+        '''
+        self.stats.submit()
+        self._idle.clear()
+        submit_time = time.time()
+        failed = True
+        queue_sec = convert_sec = 0.0
+        try:
+            loop = asyncio.get_running_loop()
+            warnings, error, start_time, end_time = await loop.run_in_executor(
+                self._executor, _convert_in_server_worker, (input_path, output_path))
+            failed = error is not None
+            queue_sec = max(0.0, start_time - submit_time)
+            convert_sec = end_time - start_time
+        finally:
+            self.stats.done(queue_sec, convert_sec, failed)
+            if self.stats.in_flight == 0:
+                self._idle.set()
+
+        return {'warnings': warnings, 'error': error, 'queue_time': queue_sec, 'convert_time': convert_sec}
+
+
+def _init_server_worker(cache, memo_size=0, sink=None):
+    '''
+    ワーカープロセスの初期化
+
+    パーサーとレンダラを生成し、起動時に変換を１回行って正規表現のコンパイルなどを済ませる
+    '''
+    pymd2re._init_worker(cache, memo_size, sink)
+
+    silent = DiagnosticSink(SilentOutput())
+    doc = mdparser.MarkdownParser(diagnostics=silent)(WARM_UP_LINES)
+    pymd2re.ReviewRenderer(diagnostics=silent)(doc)
+
+
+def _convert_in_server_worker(job):
+    '''
+    ワーカープロセスでの変換処理
+
+    警告の表示・エラーとともに、変換の開始・終了時刻を返す
+    '''
+    start_time = time.time()
+    warnings, error = pymd2re._convert_in_worker(job)
+    return warnings, error, start_time, time.time()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
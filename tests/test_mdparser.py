@@ -0,0 +1,127 @@
+'''
+mdparser.py のインクリメンタルパース処理と並列パース処理のテスト
+'''
+import os
+import random
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import benchmark  # noqa: E402
+from diagnostics import CollectOutput, DiagnosticSink, MessageLevel  # noqa: E402
+import mdparser  # noqa: E402
+
+
+def snapshot(doc):
+    '''
+    比較のために文書をバイト列に変換
+    '''
+    return mdparser.FlatDocument.from_block(doc).to_bytes()
+
+
+class TestReparse(unittest.TestCase):
+    '''
+    MarkdownParser.reparse() のテスト
+    '''
+
+    def test_random_edits(self):
+        '''
+        無作為な編集を繰り返しても、全体を解析し直した結果と一致する
+        '''
+        md_parser = mdparser.MarkdownParser()
+        pool = benchmark.make_lines(2000)
+        rng = random.Random(0)
+        lines = pool[:500]
+        doc = md_parser(lines)
+
+        for _ in range(300):
+            start = rng.randrange(len(lines) + 1)
+            end = min(len(lines), start + rng.choice([0, 1, 2]))
+            new_lines = [rng.choice(pool) for _ in range(rng.choice([0, 1, 2]))]
+            lines[start:end] = new_lines
+            md_parser.reparse(doc, lines, start, end, len(new_lines))
+            self.assertEqual(snapshot(doc), snapshot(md_parser(lines)))
+
+    def test_long_region_without_blank_lines(self):
+        '''
+        空行の無い長い範囲の編集でも、全体を解析し直した結果と一致する
+        '''
+        md_parser = mdparser.MarkdownParser()
+        lines = ['- item {}'.format(i) if i % 3 else 'para {}'.format(i) for i in range(2000)]
+        doc = md_parser(lines)
+
+        for start in (1999, 1000, 300, 0):
+            lines.insert(start, '# header')
+            md_parser.reparse(doc, lines, start, start, 1)
+            self.assertEqual(snapshot(doc), snapshot(md_parser(lines)))
+
+    def test_insert_at_top_of_large_document(self):
+        '''
+        大きな文書の先頭への1行の挿入と削除は、文書の大きさによらない一定時間内で終わる
+        '''
+        md_parser = mdparser.MarkdownParser()
+        lines = benchmark.make_lines(100000)
+        doc = md_parser(lines)
+
+        elapsed = 0.0
+        for _ in range(20):
+            lines.insert(0, 'inserted *line*')
+            start = time.perf_counter()
+            md_parser.reparse(doc, lines, 0, 0, 1)
+            elapsed += time.perf_counter() - start
+
+            del lines[0]
+            start = time.perf_counter()
+            md_parser.reparse(doc, lines, 0, 1, 0)
+            elapsed += time.perf_counter() - start
+
+        # ※以降の全てのブロックの行番号を更新する場合は数ms かかる
+        self.assertLess(elapsed / 40, 0.002)
+        self.assertEqual(snapshot(doc), snapshot(md_parser(lines)))
+
+
+
+class TestParallel(unittest.TestCase):
+    '''
+    MarkdownParser.iter_parallel() のテスト
+    '''
+
+    @staticmethod
+    def convert(lines, parse):
+        '''
+        ブロックを受け取るごとにレンダリング時の警告の代わりのメッセージを登録し、全てのメッセージを返す
+        '''
+        collected = CollectOutput()
+        sink = DiagnosticSink(collected, MessageLevel.INFO)
+        md_parser = mdparser.MarkdownParser(diagnostics=sink)
+        blocks = []
+        for block in parse(md_parser, lines):
+            sink.report(MessageLevel.WARNING, block.linenum, 'R:' + block.kind.name, 'rendered')
+            blocks.append(block)
+        sink.flush()
+
+        doc = mdparser.Block()
+        doc.subitems = blocks
+        return snapshot(doc), [(r.level, r.linenum, r.kind, r.message) for r in collected.records]
+
+    def test_message_order(self):
+        '''
+        情報メッセージとブロックごとのメッセージの順が iter_blocks() と一致する
+        '''
+        lines = []
+        for i in range(60):
+            lines += benchmark.make_lines(40)
+            # 表の列数の不一致は段落の継続行の解析中にも発生する
+            lines += ['', '> q', '> > > deep', '', 'para {}'.format(i), '| x | y |', '|--|', '| 1 | 2 | 3 |',
+                      '', '- a', '      - b', '', 'text', '']
+        lines += ['```', 'open code']
+
+        expected = self.convert(lines, lambda md_parser, lines: md_parser.iter_blocks(lines))
+        actual = self.convert(lines, lambda md_parser, lines: md_parser.iter_parallel(lines, 2, 200))
+        self.assertEqual(actual, expected)
+        self.assertIn(MessageLevel.INFO, [record[0] for record in expected[1]])
+
+
+if __name__ == '__main__':
+    unittest.main()
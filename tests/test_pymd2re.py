@@ -0,0 +1,108 @@
+'''
+pymd2re.py のコマンドライン引数のテスト
+'''
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pymd2re  # noqa: E402
+
+PYMD2RE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pymd2re.py')
+
+
+class TestArguments(unittest.TestCase):
+    '''
+    引数の組み合わせのテスト
+    '''
+
+    def _run(self, *args):
+        '''
+        pymd2re.py を実行して終了コードと標準エラー出力を返す
+
+        引数の誤りで終了しない場合(監視モードなど)はタイムアウトとする
+        '''
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_path = os.path.join(tmp_dir, 'input.md')
+            with open(input_path, 'w', encoding='utf-8') as f:
+                f.write('# Title\n')
+            result = subprocess.run([sys.executable, PYMD2RE_PATH, '--no-cache', *args, input_path,
+                                     os.path.join(tmp_dir, 'out')],
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, timeout=60)
+
+        return result.returncode, result.stderr
+
+    def test_parallel_parse_with_batch(self):
+        '''
+        --parallel-parse と --batch は同時に指定できない
+        '''
+        returncode, stderr = self._run('-b', '--parallel-parse')
+        self.assertEqual(returncode, 2)
+        self.assertIn('--parallel-parse is not allowed with --batch or --watch', stderr)
+
+    def test_parallel_parse_with_watch(self):
+        '''
+        --parallel-parse と --watch は同時に指定できない
+        '''
+        returncode, stderr = self._run('-w', '--parallel-parse')
+        self.assertEqual(returncode, 2)
+        self.assertIn('--parallel-parse is not allowed with --batch or --watch', stderr)
+
+
+class TestBatch(unittest.TestCase):
+    '''
+    バッチモードのテスト
+    '''
+
+    def _run(self, *args):
+        '''
+        pymd2re.py をバッチモードで実行して終了コードと標準出力を返す
+        '''
+        result = subprocess.run([sys.executable, PYMD2RE_PATH, '--no-cache', '-b', *args],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, timeout=60)
+
+        return result.returncode, result.stdout
+
+    def test_missing_manifest(self):
+        '''
+        読み込めないマニフェストはエラーとする
+        '''
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            returncode, stdout = self._run('@' + os.path.join(tmp_dir, 'missing.txt'), os.path.join(tmp_dir, 'out'))
+        self.assertEqual(returncode, 1)
+        self.assertIn('Error: cannot read manifest', stdout)
+
+    def test_no_input_files(self):
+        '''
+        入力ファイルが無い場合はエラーとする
+        '''
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            returncode, stdout = self._run(tmp_dir, os.path.join(tmp_dir, 'out'))
+        self.assertEqual(returncode, 1)
+        self.assertIn('Error: no input files', stdout)
+
+    def test_worker_error(self):
+        '''
+        変換中の想定外のエラーはそのファイルの失敗として返す
+        '''
+        class BrokenParser:
+            def iter_blocks(self, lines):
+                raise RuntimeError('broken')
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_path = os.path.join(tmp_dir, 'input.md')
+            with open(input_path, 'w', encoding='utf-8') as f:
+                f.write('# Title\n')
+            pymd2re._init_worker(None)
+            pymd2re._worker_parser = BrokenParser()
+            try:
+                warnings, error = pymd2re._convert_in_worker((input_path, os.path.join(tmp_dir, 'input.re')))
+            finally:
+                pymd2re._init_worker(None)
+        self.assertEqual(error, 'RuntimeError: broken')
+
+
+if __name__ == '__main__':
+    unittest.main()